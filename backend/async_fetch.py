@@ -0,0 +1,223 @@
+"""
+asyncio image fetch engine.
+
+Why: `http_client.fetch_bytes` is synchronous `requests` code, so every
+concurrent download costs an OS thread and retries `time.sleep` while holding
+it. Thread-per-download is what capped candidate volume. This engine runs one
+event loop on a daemon thread with a single pooled aiohttp session, so
+hundreds of downloads can be in flight at the cost of a coroutine each.
+
+Semantics match `fetch_bytes`: same default headers, Referer inference via
+`_infer_referer`, content-type filtering, `MAX_RESPONSE_BYTES` cap, image
+header sniffing, retry policy including `Retry-After` host cooldowns (backoff
+is an `asyncio.sleep`, so it doesn't hold anything), the on-disk response
+cache and the negative cache of recent failures.
+
+Sync code (pipeline threads) hands coroutines to the loop with
+`AsyncFetcher.submit`, which returns a `concurrent.futures.Future`.
+Coroutines that call `AsyncFetcher.fetch_bytes` must run on that loop.
+
+aiohttp is optional: without it `get_fetcher()` returns None and callers stay
+on the threaded `requests` path.
+"""
+from __future__ import annotations
+
+import asyncio
+import os
+import re
+import threading
+from concurrent.futures import Future
+from typing import Any, Coroutine, Dict, Optional, Tuple
+
+try:
+    import aiohttp  # type: ignore
+except ImportError:  # pragma: no cover - optional dependency
+    aiohttp = None
+
+from http_client import (
+    DEFAULT_HEADERS,
+    DEFAULT_TIMEOUT,
+    MAX_RETRY_AFTER_S,
+    RETRY_STATUSES,
+    _BodyReader,
+    _READ_CHUNK,
+    _accepted_content_type,
+    _cache_lookup,
+    _cache_revalidated,
+    _cache_store,
+    _declared_too_large,
+    _governor,
+    _host_of,
+    host_limit,
+    _negative_cache,
+    _remember_content_type,
+    _remember_status,
+    known_failure,
+    remember_failure,
+    _request_headers,
+    _retry_after_hint,
+)
+from retry_scheduler import backoff_delay, get_scheduler
+
+
+# Upper bound on concurrent connections from the shared session.
+MAX_INFLIGHT = int(os.environ.get("ASYNC_FETCH_MAX_INFLIGHT", "256"))
+
+
+class AsyncFetcher:
+    """
+    An event loop on a daemon thread plus one pooled aiohttp session.
+    Requests per host are capped at `host_limit(host)` (HTTP_HOST_LIMIT /
+    HTTP_HOST_LIMITS), like the threaded path's `HostGovernor`.
+    """
+
+    def __init__(self, max_inflight: int = MAX_INFLIGHT) -> None:
+        if aiohttp is None:
+            raise RuntimeError("aiohttp is not installed")
+        self.max_inflight = max(1, int(max_inflight))
+        # Only touched from the fetch loop, so no lock.
+        self._host_semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._loop.run_forever, name="async-fetch", daemon=True
+        )
+        self._thread.start()
+        self._session = self.run(self._open_session())
+
+    async def _open_session(self) -> "aiohttp.ClientSession":
+        # Per-host limits are the host semaphores' job, not the connector's.
+        connector = aiohttp.TCPConnector(limit=self.max_inflight, limit_per_host=0)
+        connect_s, read_s = DEFAULT_TIMEOUT
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=connect_s, sock_read=read_s)
+        return aiohttp.ClientSession(
+            connector=connector, timeout=timeout, headers=DEFAULT_HEADERS
+        )
+
+    def _host_semaphore(self, host: str) -> asyncio.Semaphore:
+        sem = self._host_semaphores.get(host)
+        if sem is None:
+            sem = self._host_semaphores[host] = asyncio.Semaphore(host_limit(host))
+        return sem
+
+    def submit(self, coro: Coroutine[Any, Any, Any]) -> Future:
+        """Schedule `coro` on the fetch loop from any thread."""
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    def run(self, coro: Coroutine[Any, Any, Any], timeout: Optional[float] = None) -> Any:
+        """Run `coro` on the fetch loop and block for its result."""
+        return self.submit(coro).result(timeout)
+
+    async def fetch_bytes(
+        self,
+        url: str,
+        *,
+        referer: Optional[str] = None,
+        allow_html: bool = False,
+        max_retries: int = 2,
+        user_agent: Optional[str] = None,
+        stop_at: Optional[re.Pattern] = None,
+    ) -> Optional[Tuple[bytes, str]]:
+        """Async twin of `http_client.fetch_bytes`; same arguments and results."""
+        if known_failure(url) is not None:
+            return None
+        headers = _request_headers(url, referer, user_agent)
+        host = _host_of(url)
+        # The response cache is SQLite + files; keep it off the event loop.
+        cached = await asyncio.to_thread(_cache_lookup, url)
+        if cached is not None:
+            if cached.fresh:
+                return cached.body, cached.content_type
+            headers.update(cached.conditional_headers())
+        for attempt in range(max_retries + 1):
+            # Share Retry-After cooldowns with the threaded path.
+            wait = _governor.cooldown_remaining(host)
+            if wait:
+                await asyncio.sleep(wait)
+            hint: Optional[float] = None
+            try:
+                # Held through the body read, as on the threaded path.
+                async with self._host_semaphore(host), self._session.get(
+                    url, headers=headers, allow_redirects=True
+                ) as resp:
+                    if resp.status == 304 and cached is not None:
+                        return await asyncio.to_thread(_cache_revalidated, cached, resp.headers)
+                    if resp.status not in RETRY_STATUSES:
+                        result = await _read_response(resp, url, allow_html, stop_at)
+                        if result is not None:
+                            _negative_cache.record_success(host)
+                            await asyncio.to_thread(
+                                _cache_store, url, str(resp.url), result, resp.headers
+                            )
+                        return result
+                    reason = f"http {resp.status}"
+                    hint = _retry_after_hint(host, resp.status, resp.headers.get("Retry-After"))
+                    if hint is not None and hint > MAX_RETRY_AFTER_S:
+                        _negative_cache.block_host(host, f"retry-after {hint:.0f}s", hint)
+                        return None
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                reason = "network"
+            if attempt >= max_retries:
+                remember_failure(url, reason, transient=True)
+                return None
+            delay = backoff_delay(attempt, hint)
+            get_scheduler().note(delay, reason)
+            # Sleep outside the `async with` so the connection goes back to
+            # the pool while we wait.
+            await asyncio.sleep(delay)
+        return None
+
+    def close(self) -> None:
+        try:
+            self.run(self._session.close(), timeout=5)
+        finally:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+
+
+async def _read_response(
+    resp: "aiohttp.ClientResponse",
+    url: str,
+    allow_html: bool,
+    stop_at: Optional[re.Pattern] = None,
+) -> Optional[Tuple[bytes, str]]:
+    if resp.status != 200:
+        _remember_status(url, resp.status)
+        return None
+    content_type, acceptable = _accepted_content_type(resp.headers.get("Content-Type"), allow_html)
+    if not acceptable:
+        _remember_content_type(url, content_type)
+        return None
+    if _declared_too_large(resp.headers):
+        remember_failure(url, "too large")
+        return None
+    reader = _BodyReader(content_type, stop_at)
+    # Like the sync path, a failed body read is final.
+    try:
+        async for chunk in resp.content.iter_chunked(_READ_CHUNK):
+            reason = reader.add(chunk)
+            if reason is not None:
+                remember_failure(url, reason)
+                return None
+            if reader.complete:
+                # Leaving the response half-read makes aiohttp close the
+                # connection instead of pooling it.
+                break
+    except (aiohttp.ClientError, asyncio.TimeoutError):
+        remember_failure(url, "read error", transient=True)
+        return None
+    return reader.body(), content_type
+
+
+_fetcher: Optional[AsyncFetcher] = None
+_fetcher_lock = threading.Lock()
+
+
+def get_fetcher() -> Optional[AsyncFetcher]:
+    """Shared fetcher, started on first use. None when aiohttp is missing."""
+    global _fetcher
+    if aiohttp is None:
+        return None
+    if _fetcher is None:
+        with _fetcher_lock:
+            if _fetcher is None:
+                _fetcher = AsyncFetcher()
+    return _fetcher
@@ -0,0 +1,138 @@
+"""
+Benchmark: Bing tile parsing, three position-aligned findall passes vs the
+single-pass `search_images._parse_tiles`.
+
+Runs both parsers over Bing async-images pages (backend/benchmarks/fixtures/
+bing_*.html, or any saved pages given on the command line) and reports time
+per page, tiles found, and how many tiles the old parser gave the wrong
+page URL or title. Titles are compared after JSON unescaping (the old
+parser kept `\u2022` etc. as-is); an old title that is a prefix of the right
+one counts as truncated (the old regex stops at an escaped quote), not
+misaligned.
+
+The bundled fixture mirrors the markup of a Bing async page, including a
+tile without a page URL, an untitled tile and tiles without a caption. To
+benchmark a live page, save e.g.
+    https://www.bing.com/images/async?q=jane+doe&first=0&count=35&adlt=off
+and pass its path.
+
+Usage (from backend/):
+    python benchmarks/bench_bing_parse.py [--repeat N] [paths...]
+"""
+from __future__ import annotations
+
+import argparse
+import glob
+import json
+import os
+import re
+import sys
+import time
+from typing import Callable, Dict, List
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+_MURL_RE = re.compile(r"murl&quot;:&quot;(.*?)&quot;")
+_PURL_RE = re.compile(r"purl&quot;:&quot;(.*?)&quot;")
+_TITLE_RE = re.compile(r"t&quot;:&quot;(.*?)&quot;")
+
+
+def _decode(s: str) -> str:
+    return (
+        s.replace("&amp;", "&")
+        .replace("&quot;", '"')
+        .replace("\\u0026", "&")
+        .replace("\\/", "/")
+    )
+
+
+def _legacy_parse(html: str) -> List[Dict[str, str]]:
+    murls = _MURL_RE.findall(html)
+    purls = _PURL_RE.findall(html)
+    titles = _TITLE_RE.findall(html)
+    tiles = []
+    for i, murl in enumerate(murls):
+        tiles.append(
+            {
+                "url": _decode(murl),
+                "page_url": _decode(purls[i]) if i < len(purls) else _decode(murl),
+                "title": _decode(titles[i]) if i < len(titles) else f"Bing result {i + 1}",
+            }
+        )
+    return tiles
+
+
+def _unescape_title(title: str) -> str:
+    # A title cut at an escaped quote ends in a lone backslash.
+    if title.endswith("\\") and not title.endswith("\\\\"):
+        title = title[:-1]
+    try:
+        return json.loads(f'"{title}"')
+    except ValueError:
+        return title
+
+
+def _single_pass_parse(html: str) -> List[Dict]:
+    from search_images import _parse_tiles
+
+    return _parse_tiles(html)
+
+
+def _time(fn: Callable[[str], List], pages: List[str], repeat: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        for page in pages:
+            fn(page)
+    return (time.perf_counter() - t0) / (repeat * len(pages))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("paths", nargs="*")
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    paths = args.paths or sorted(
+        glob.glob(os.path.join(BACKEND_DIR, "benchmarks", "fixtures", "bing_*.html"))
+    )
+    pages = []
+    for p in paths:
+        with open(p, encoding="utf-8") as f:
+            pages.append(f.read())
+    if not pages:
+        sys.exit("No pages found")
+
+    legacy_tiles = [_legacy_parse(p) for p in pages]
+    new_tiles = [_single_pass_parse(p) for p in pages]
+    wrong_page_url = wrong_title = truncated_title = 0
+    for old, new in zip(legacy_tiles, new_tiles):
+        by_url = {t["url"]: t for t in new}
+        for t in old:
+            ref = by_url.get(t["url"])
+            if ref is None:
+                continue
+            wrong_page_url += t["page_url"] != ref["page_url"]
+            title = _unescape_title(t["title"])
+            if title != ref["title"]:
+                if title and ref["title"].startswith(title):
+                    truncated_title += 1
+                else:
+                    wrong_title += 1
+    sized = sum(1 for tiles in new_tiles for t in tiles if t["width"])
+
+    print(f"{len(pages)} page(s), {sum(len(p) for p in pages) // 1024} KB, repeat={args.repeat}")
+    legacy_s = _time(_legacy_parse, pages, args.repeat)
+    new_s = _time(_single_pass_parse, pages, args.repeat)
+    print(f"{'parser':<14}{'ms/page':>10}{'tiles':>8}")
+    print(f"{'findall x3':<14}{1000 * legacy_s:>10.3f}{sum(map(len, legacy_tiles)):>8}")
+    print(f"{'single pass':<14}{1000 * new_s:>10.3f}{sum(map(len, new_tiles)):>8}")
+    print(f"old parser: wrong page_url {wrong_page_url}, wrong title {wrong_title}, "
+          f"title truncated {truncated_title}")
+    print(f"tiles with original dimensions: {sized}")
+    if legacy_s:
+        print(f"single pass time / findall x3 time: {new_s / legacy_s:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Benchmark: candidate image decode + downscale, old path vs image_decode.
+
+Compares the previous `_prepare_image_file` behaviour (full-resolution decode
+then LANCZOS to 1024px) with `image_decode.decode_downscaled` (libjpeg DCT
+scaling via `draft()` + cheaper filter for large reductions) on the images
+in backend/dataset (or any paths given on the command line).
+
+Each mode runs in a fresh subprocess so peak RSS is measured independently.
+
+Usage (from backend/):
+    python benchmarks/bench_decode.py [--repeat N] [paths...]
+"""
+from __future__ import annotations
+
+import argparse
+import glob
+import multiprocessing as mp
+import os
+import resource
+import sys
+import time
+from io import BytesIO
+from typing import Dict, List
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+MAX_EDGE = 1024
+
+
+def _legacy_decode(data: bytes):
+    from PIL import Image
+
+    img = Image.open(BytesIO(data))
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    w, h = img.size
+    longest = max(w, h)
+    if longest > MAX_EDGE:
+        scale = MAX_EDGE / float(longest)
+        img = img.resize((int(w * scale), int(h * scale)), Image.LANCZOS)
+    return img
+
+
+def _reduced_decode(data: bytes):
+    from image_decode import decode_downscaled
+
+    return decode_downscaled(data, MAX_EDGE)
+
+
+_MODES = {"legacy": _legacy_decode, "reduced": _reduced_decode}
+
+
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS reports bytes.
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _run_mode(mode: str, blobs: List[bytes], repeat: int, out) -> None:
+    fn = _MODES[mode]
+    baseline = _peak_rss_mb()
+    fn(blobs[0])  # warm up imports
+    times = []
+    for _ in range(repeat):
+        for data in blobs:
+            t0 = time.perf_counter()
+            img = fn(data)
+            img.load()
+            times.append(time.perf_counter() - t0)
+    out.send({
+        "mode": mode,
+        "total_s": sum(times),
+        "mean_ms": 1000 * sum(times) / len(times),
+        "max_ms": 1000 * max(times),
+        "peak_rss_mb": _peak_rss_mb(),
+        "rss_growth_mb": _peak_rss_mb() - baseline,
+    })
+    out.close()
+
+
+def _measure(mode: str, blobs: List[bytes], repeat: int) -> Dict:
+    ctx = mp.get_context("spawn")
+    parent, child = ctx.Pipe(duplex=False)
+    proc = ctx.Process(target=_run_mode, args=(mode, blobs, repeat, child))
+    proc.start()
+    result = parent.recv()
+    proc.join()
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("paths", nargs="*")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    paths = args.paths or sorted(glob.glob(os.path.join(BACKEND_DIR, "dataset", "*", "*")))
+    blobs = []
+    for p in paths:
+        with open(p, "rb") as f:
+            blobs.append(f.read())
+    if not blobs:
+        sys.exit("No images found")
+
+    from PIL import Image
+
+    sizes = [max(Image.open(BytesIO(b)).size) for b in blobs]
+    large = sum(1 for s in sizes if s > 2 * MAX_EDGE)
+    print(f"{len(blobs)} images, {large} larger than {2 * MAX_EDGE}px, repeat={args.repeat}")
+
+    results = [_measure(mode, blobs, args.repeat) for mode in _MODES]
+    print(f"{'mode':<10}{'total s':>10}{'mean ms':>10}{'max ms':>10}{'peak RSS MB':>14}{'growth MB':>12}")
+    for r in results:
+        print(
+            f"{r['mode']:<10}{r['total_s']:>10.2f}{r['mean_ms']:>10.1f}{r['max_ms']:>10.1f}"
+            f"{r['peak_rss_mb']:>14.1f}{r['rss_growth_mb']:>12.1f}"
+        )
+    legacy, reduced = results
+    if reduced["total_s"]:
+        print(f"speedup: {legacy['total_s'] / reduced['total_s']:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Micro-batching front end for the face-embedding model.
+
+Why: `match_faces` runs several worker threads, but Facenet512 inference used
+to be serialized one image at a time behind a global lock. Workers spent most
+of their time waiting on that lock, and Keras pays a large fixed cost per
+forward pass regardless of how many faces are in it.
+
+This module owns a single consumer thread that:
+- Collects preprocessed face crops submitted by any worker.
+- Waits at most `max_wait_ms` for more crops to arrive once the first one is
+  queued, or until `max_batch_size` crops are pending.
+- Stacks them into one `(N, H, W, C)` tensor and runs the model once.
+- Hands each worker its own row of the output via a `Future`.
+
+Workers keep doing download, decode and face detection in parallel; only the
+forward pass is shared.
+"""
+from __future__ import annotations
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+class EmbeddingBatcher:
+    """
+    Batch face crops from many threads into single model calls.
+
+    `forward` receives a stacked `(N, H, W, C)` array and must return an
+    `(N, D)` array-like of embeddings in the same order.
+    """
+
+    def __init__(
+        self,
+        forward: Callable[[np.ndarray], np.ndarray],
+        max_batch_size: int = 16,
+        max_wait_ms: float = 10.0,
+        name: str = "embedding-batcher",
+    ) -> None:
+        self._forward = forward
+        self._max_batch_size = max(1, int(max_batch_size))
+        self._max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self._name = name
+        self._queue: "queue.Queue[Tuple[np.ndarray, Future]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._batches = 0
+        self._faces = 0
+        self._largest_batch = 0
+
+    def submit(self, face: np.ndarray) -> Future:
+        """Queue one preprocessed face (`(1, H, W, C)` or `(H, W, C)`)."""
+        if face.ndim == 3:
+            face = np.expand_dims(face, axis=0)
+        self._ensure_started()
+        fut: Future = Future()
+        self._queue.put((face, fut))
+        return fut
+
+    def embed(self, face: np.ndarray, timeout: Optional[float] = None) -> np.ndarray:
+        """Blocking convenience wrapper around `submit`."""
+        return self.submit(face).result(timeout=timeout)
+
+    def stats(self) -> Dict[str, float]:
+        with self._stats_lock:
+            avg = (self._faces / self._batches) if self._batches else 0.0
+            return {
+                "batches": self._batches,
+                "faces": self._faces,
+                "avg_batch_size": round(avg, 2),
+                "largest_batch": self._largest_batch,
+            }
+
+    # ------------------------------------------------------------------
+
+    def _ensure_started(self) -> None:
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                t = threading.Thread(target=self._run, name=self._name, daemon=True)
+                t.start()
+                self._thread = t
+
+    def _collect(self) -> List[Tuple[np.ndarray, Future]]:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self._max_wait
+        while len(batch) < self._max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    # Still drain anything that is already waiting.
+                    batch.append(self._queue.get_nowait())
+                else:
+                    batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._collect()
+            # Drop crops whose caller already gave up.
+            batch = [(face, fut) for face, fut in batch if fut.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                stacked = np.concatenate([face for face, _ in batch], axis=0)
+                out = np.asarray(self._forward(stacked))
+                if out.ndim == 1:
+                    out = out.reshape(1, -1)
+            except Exception as e:
+                for _, fut in batch:
+                    fut.set_exception(e)
+                continue
+
+            with self._stats_lock:
+                self._batches += 1
+                self._faces += len(batch)
+                self._largest_batch = max(self._largest_batch, len(batch))
+            for i, (_, fut) in enumerate(batch):
+                fut.set_result(np.array(out[i]))
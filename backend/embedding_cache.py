@@ -0,0 +1,128 @@
+"""
+Persistent, content-addressed cache of face embeddings.
+
+Why: the same celebrity and social-profile photos come back from the search
+engines across many users' searches, and each one used to be re-detected and
+re-embedded on every `/upload`. Keying on the SHA-256 of the downloaded bytes
+lets any later request skip detection and inference for an image we've
+already seen, no matter which URL it came from.
+
+- Stores the 512-d vector as float32 bytes, or a NULL "no face" tombstone so
+  known faceless images are rejected without touching the model.
+- SQLite in WAL mode, so several gunicorn workers can share one file.
+- Size-based LRU: every hit refreshes `last_used`; once the stored vectors
+  exceed `max_bytes`, the least recently used rows are dropped.
+"""
+from __future__ import annotations
+
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional, Tuple
+
+import numpy as np
+
+
+# Rough per-row overhead (key, index entry, timestamps) on top of the vector.
+_ROW_OVERHEAD_BYTES = 128
+
+
+class EmbeddingCache:
+    def __init__(self, path: str, max_bytes: int, namespace: str = "") -> None:
+        self._path = path
+        self._max_bytes = max(0, int(max_bytes))
+        # Embeddings depend on the model + detector, not just the pixels.
+        self._namespace = namespace
+        self._lock = threading.Lock()
+
+        parent = os.path.dirname(path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key TEXT PRIMARY KEY,
+                vector BLOB,
+                nbytes INTEGER NOT NULL,
+                last_used REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings(last_used)"
+        )
+        self._conn.commit()
+        row = self._conn.execute("SELECT COALESCE(SUM(nbytes), 0) FROM embeddings").fetchone()
+        self._total_bytes = int(row[0])
+
+    def _key(self, digest: str) -> str:
+        return f"{self._namespace}:{digest}" if self._namespace else digest
+
+    def get(self, digest: str) -> Tuple[bool, Optional[np.ndarray]]:
+        """
+        Return `(hit, embedding)`. On a hit, `embedding` is None for a cached
+        "no face" tombstone.
+        """
+        key = self._key(digest)
+        try:
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT vector FROM embeddings WHERE key = ?", (key,)
+                ).fetchone()
+                if row is None:
+                    return False, None
+                self._conn.execute(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?", (time.time(), key)
+                )
+                self._conn.commit()
+        except sqlite3.Error as e:
+            print(f"[EmbeddingCache] Read error: {e}")
+            return False, None
+        blob = row[0]
+        if blob is None:
+            return True, None
+        return True, np.frombuffer(blob, dtype=np.float32).astype(np.float64)
+
+    def put(self, digest: str, embedding: Optional[np.ndarray]) -> None:
+        """Store an embedding, or a tombstone when `embedding` is None."""
+        key = self._key(digest)
+        blob = None
+        if embedding is not None:
+            blob = np.asarray(embedding, dtype=np.float32).tobytes()
+        nbytes = (len(blob) if blob else 0) + _ROW_OVERHEAD_BYTES
+        try:
+            with self._lock:
+                old = self._conn.execute(
+                    "SELECT nbytes FROM embeddings WHERE key = ?", (key,)
+                ).fetchone()
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO embeddings (key, vector, nbytes, last_used) "
+                    "VALUES (?, ?, ?, ?)",
+                    (key, blob, nbytes, time.time()),
+                )
+                self._total_bytes += nbytes - (int(old[0]) if old else 0)
+                if self._max_bytes and self._total_bytes > self._max_bytes:
+                    self._evict_locked()
+                self._conn.commit()
+        except sqlite3.Error as e:
+            print(f"[EmbeddingCache] Write error: {e}")
+
+    def _evict_locked(self) -> None:
+        # Evict down to 90% so we don't run an eviction on every insert.
+        target = int(self._max_bytes * 0.9)
+        rows = self._conn.execute(
+            "SELECT key, nbytes FROM embeddings ORDER BY last_used ASC"
+        )
+        doomed = []
+        freed = 0
+        for key, nbytes in rows:
+            if self._total_bytes - freed <= target:
+                break
+            doomed.append((key,))
+            freed += int(nbytes)
+        self._conn.executemany("DELETE FROM embeddings WHERE key = ?", doomed)
+        self._total_bytes -= freed
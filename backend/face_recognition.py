@@ -6,29 +6,59 @@ Improvements over the original:
   model initialization.
 - Uses a shared HTTP session (browser UA, retries) and resolves social-media
   crawler URLs to their real CDN image URL.
-- Parallelizes candidate processing with a ThreadPoolExecutor; each worker
-  writes to its own tempfile (the old code shared `/tmp/temp_face.jpg`,
-  which serialized everything).
-- Downscales images before detection (faster, less memory).
-- Reuses already-downloaded bytes for SHA-256 hashing instead of issuing a
-  second HTTP request.
+- Runs candidates through a staged pipeline (fetch -> decode -> detect ->
+  embed) with bounded queues and per-stage worker counts (see
+  staged_pipeline.py). Downloads run as coroutines on the asyncio fetch
+  engine (see async_fetch.py) when aiohttp is installed.
+- Decodes and downscales candidate images in memory and hands the numpy
+  array straight to DeepFace: no tempfile, no JPEG re-encode, no second
+  decode. JPEGs are decoded at reduced size in the DCT domain (see
+  image_decode.py).
+- Hashes every downloaded candidate up front and looks it up in a persistent
+  embedding cache (see embedding_cache.py) before detection and inference.
+- Face detection runs in the workers; the Facenet512 forward pass goes through
+  a shared micro-batcher (see embedding_batcher.py) instead of one image at a
+  time behind a global lock.
+- Rejects obvious no-face candidates with a cheap Haar-cascade pass on a
+  thumbnail (see face_prefilter.py) before they reach the detector or model,
+  and reports "no face" as a return value instead of a raised exception.
+- Indexes a perceptual hash of every decoded candidate so resized or
+  recompressed copies of one photo reuse a single embedding and collapse to
+  one match (see perceptual_hash.py).
+- Optionally offloads detection + embedding to a pool of worker processes
+  (see inference_pool.py) so one request can use more than one core.
 """
 from __future__ import annotations
 
 import hashlib
+import multiprocessing
 import os
-import tempfile
 import threading
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from io import BytesIO
-from typing import Dict, List, Optional, Tuple
+import time
+from concurrent.futures import Future
+from functools import partial
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sized, Tuple
 
 import numpy as np
-from PIL import Image
 from deepface import DeepFace
-
-from http_client import fetch_bytes
-from social_resolver import fetch_image_bytes_with_resolve
+from deepface.modules import preprocessing
+
+from embedding_batcher import EmbeddingBatcher
+from embedding_cache import EmbeddingCache
+from face_prefilter import has_face_candidate
+from image_decode import decode_downscaled
+from inference_pool import InferencePool
+from perceptual_hash import NearDuplicateIndex, dhash
+from staged_pipeline import Stage, StagedPipeline
+from async_fetch import get_fetcher
+from http_client import fetch_bytes, http_cache_stats, known_failure, negative_cache_stats
+from retry_scheduler import retry_stats
+from social_resolver import (
+    fetch_image_bytes_with_resolve,
+    fetch_image_bytes_with_resolve_async,
+    fetch_image_bytes_with_resolve_deferred,
+    resolve_cache_stats,
+)
 
 
 # Preload model once so DeepFace.represent doesn't re-init per call.
@@ -43,41 +73,80 @@ except Exception as _e:
 # acceptable accuracy for our similarity threshold.
 _DETECTOR_BACKEND = os.environ.get("FACE_DETECTOR_BACKEND", "opencv")
 
+# Build the detector up front too: DeepFace caches it in a module-level dict
+# and the first concurrent calls would otherwise race to construct it.
+try:
+    DeepFace.build_model(task="face_detector", model_name=_DETECTOR_BACKEND)
+except Exception as _e:
+    print(f"[Face] Warning: detector preload failed ({_e}); will build on demand")
+
 # Max edge for images passed to DeepFace. Larger images waste detector time.
 _MAX_IMAGE_EDGE = 1024
 
-# I/O-bound; we can afford more workers than CPU cores.
-_MAX_WORKERS = int(os.environ.get("FACE_MATCH_WORKERS", "6"))
+# Micro-batching knobs: a batch is flushed when it reaches FACE_BATCH_SIZE
+# crops or FACE_BATCH_WAIT_MS after its first crop arrived, whichever is first.
+_BATCH_SIZE = int(os.environ.get("FACE_BATCH_SIZE", "16"))
+_BATCH_WAIT_MS = float(os.environ.get("FACE_BATCH_WAIT_MS", "10"))
+
+# Persistent embedding cache keyed by image SHA-256. Set
+# EMBEDDING_CACHE_PATH to an empty string to disable it.
+_EMBEDDING_CACHE_PATH = os.environ.get("EMBEDDING_CACHE_PATH", "cache/embeddings.sqlite3")
+_EMBEDDING_CACHE_MAX_MB = int(os.environ.get("EMBEDDING_CACHE_MAX_MB", "256"))
+
+# Cheap Haar-cascade face-presence check before the real detector. It is a
+# frontal-only cascade (see face_prefilter.py), so it defaults on only for the
+# "opencv" backend; FACE_PREFILTER=1/0 forces it either way.
+_PREFILTER_ENABLED = os.environ.get(
+    "FACE_PREFILTER", "1" if _DETECTOR_BACKEND == "opencv" else "0"
+) != "0"
+
+# Collapse resized/recompressed copies of the same photo within a request
+# (dHash Hamming distance). Set NEAR_DUP_MAX_DISTANCE=-1 to disable.
+_NEAR_DUP_MAX_DISTANCE = int(os.environ.get("NEAR_DUP_MAX_DISTANCE", "6"))
+# How long a copy waits for the first copy's embedding before giving up.
+_NEAR_DUP_WAIT_S = 60.0
+
+# Number of inference worker processes. 0 keeps inference in-process.
+_INFERENCE_PROCESSES = int(os.environ.get("FACE_INFERENCE_PROCESSES", "0"))
+
+# Per-stage concurrency for `match_faces` (see staged_pipeline.py). Fetching
+# is I/O-bound, so fetchers far outnumber decoders. Detection needs at least
+# one worker per inference process to keep the pool busy. Embed workers only
+# wait on the micro-batcher, so one per batch slot lets batches fill up.
+# FACE_MATCH_WORKERS is the old single-pool knob, kept as a fallback.
+_FETCH_WORKERS = int(os.environ.get("FACE_FETCH_WORKERS", os.environ.get("FACE_MATCH_WORKERS", "16")))
+_DECODE_WORKERS = int(os.environ.get("FACE_DECODE_WORKERS", "3"))
+_DETECT_WORKERS = int(os.environ.get("FACE_DETECT_WORKERS", str(max(2, _INFERENCE_PROCESSES))))
+_EMBED_WORKERS = int(os.environ.get("FACE_EMBED_WORKERS", str(_BATCH_SIZE)))
+# "async" fetches on the shared asyncio engine (async_fetch.py), where
+# ASYNC_FETCH_MAX_INFLIGHT bounds concurrent downloads; "threads" keeps up to
+# FACE_FETCH_WORKERS downloads in flight on the retry scheduler's pool
+# (RETRY_WORKERS threads). Without aiohttp we always use threads.
+_FETCH_ENGINE = os.environ.get("FACE_FETCH_ENGINE", "async")
+# Bound on each inter-stage queue; fetchers block once decoders fall behind.
+_STAGE_QUEUE_SIZE = int(os.environ.get("FACE_STAGE_QUEUE_SIZE", "32"))
 
 _model_lock = threading.Lock()
 
+# Neural detector backends run on TensorFlow too; keep them off the Keras
+# graph concurrently. OpenCV's Haar cascade is safe to call from many threads.
+_detector_lock = threading.Lock() if _DETECTOR_BACKEND not in ("opencv", "skip") else None
 
-def _prepare_image_file(image_bytes: bytes, out_path: str) -> bool:
-    """Decode, downscale, and re-encode as JPEG. Returns False on failure."""
+
+def _decode_rgb(image_bytes: bytes) -> Optional[np.ndarray]:
+    """Decode and downscale to an RGB uint8 array. Returns None on failure."""
     try:
-        img = Image.open(BytesIO(image_bytes))
-        if img.mode not in ("RGB", "L"):
-            img = img.convert("RGB")
-        elif img.mode == "L":
-            img = img.convert("RGB")
-        w, h = img.size
-        longest = max(w, h)
-        if longest > _MAX_IMAGE_EDGE:
-            scale = _MAX_IMAGE_EDGE / float(longest)
-            img = img.resize((int(w * scale), int(h * scale)), Image.LANCZOS)
-        img.save(out_path, format="JPEG", quality=90)
-        return True
+        return np.asarray(decode_downscaled(image_bytes, _MAX_IMAGE_EDGE))
     except Exception as e:
         print(f"[Face] Could not decode image bytes: {e}")
-        return False
+        return None
 
 
 def _represent(image_path: str, enforce_detection: bool = True):
-    """Thread-safe wrapper around DeepFace.represent."""
+    """Thread-safe wrapper around DeepFace.represent (fallback when the
+    model could not be preloaded and the batcher is unavailable)."""
     # DeepFace caches models via a module-level dict; calls from multiple
-    # threads concurrently into Keras can be flaky. A coarse lock around the
-    # inference call keeps us correct with little real-world cost because
-    # HTTP I/O and image decoding still run in parallel.
+    # threads concurrently into Keras can be flaky.
     with _model_lock:
         return DeepFace.represent(
             img_path=image_path,
@@ -87,15 +156,150 @@ def _represent(image_path: str, enforce_detection: bool = True):
         )
 
 
+def _detect_face(image) -> Optional[np.ndarray]:
+    """
+    Detect the first face in `image` (path or BGR array) and return it
+    preprocessed exactly like DeepFace.represent does: BGR, padded-resized to
+    the model input shape, `(1, H, W, 3)`. Returns None if there is no face.
+    """
+    # enforce_detection=False: DeepFace then returns the whole image with
+    # confidence 0 instead of raising, so the common "no face" outcome
+    # doesn't pay for building and formatting an exception.
+    kwargs = dict(
+        img_path=image,
+        detector_backend=_DETECTOR_BACKEND,
+        enforce_detection=False,
+        align=True,
+    )
+    if _detector_lock is not None:
+        with _detector_lock:
+            faces = DeepFace.extract_faces(**kwargs)
+    else:
+        faces = DeepFace.extract_faces(**kwargs)
+    if not faces:
+        return None
+    first = faces[0]
+    area = first["facial_area"]
+    if first["confidence"] == 0 and area["x"] == 0 and area["y"] == 0:
+        height, width = first["face"].shape[:2]
+        if area["w"] >= width - 1 and area["h"] >= height - 1:
+            return None
+    face = first["face"][:, :, ::-1]
+    target_h, target_w = _MODEL.input_shape[1], _MODEL.input_shape[0]
+    face = preprocessing.resize_image(img=face, target_size=(target_h, target_w))
+    return preprocessing.normalize_input(img=face, normalization="base")
+
+
+def _forward_batch(batch: np.ndarray) -> np.ndarray:
+    # Only the batcher thread lands here, but the fallback `_represent` path
+    # can still touch Keras, so share its lock.
+    with _model_lock:
+        return _MODEL.model(batch, training=False).numpy()
+
+
+_batcher: Optional[EmbeddingBatcher] = (
+    EmbeddingBatcher(_forward_batch, max_batch_size=_BATCH_SIZE, max_wait_ms=_BATCH_WAIT_MS)
+    if _MODEL is not None
+    else None
+)
+
+
+def _embed(image) -> Optional[np.ndarray]:
+    """Detect + embed one image. Returns None when there is no face (the
+    `_represent` fallback still raises DeepFace's ValueError)."""
+    if _batcher is None:
+        result = _represent(image, enforce_detection=True)
+        if not result:
+            return None
+        return np.array(result[0]["embedding"])
+    face = _detect_face(image)
+    if face is None:
+        return None
+    return _batcher.embed(face)
+
+
+_embedding_cache: Optional[EmbeddingCache] = None
+_embedding_cache_failed = False
+_embedding_cache_lock = threading.Lock()
+# Set in inference pool workers by `configure_inference_worker`.
+_inference_worker = False
+
+
+def configure_inference_worker() -> None:
+    """
+    Called from the inference pool's worker initializer. A worker only embeds
+    images for its parent: it never opens the embedding cache or starts a
+    pool of its own. Spawn imports this module (through main.py) before the
+    initializer runs, so this can't be done with environment variables.
+    """
+    global _inference_worker
+    _inference_worker = True
+
+
+def _get_embedding_cache() -> Optional[EmbeddingCache]:
+    """Shared cache, opened on first use. None when disabled or unavailable."""
+    global _embedding_cache, _embedding_cache_failed
+    if _embedding_cache is None and _EMBEDDING_CACHE_PATH and not (
+        _embedding_cache_failed or _inference_worker
+    ):
+        with _embedding_cache_lock:
+            if _embedding_cache is None and not _embedding_cache_failed:
+                try:
+                    _embedding_cache = EmbeddingCache(
+                        _EMBEDDING_CACHE_PATH,
+                        max_bytes=_EMBEDDING_CACHE_MAX_MB * 1024 * 1024,
+                        namespace=f"Facenet512/{_DETECTOR_BACKEND}",
+                    )
+                except Exception as e:
+                    _embedding_cache_failed = True
+                    print(f"[Face] Warning: embedding cache disabled ({e})")
+    return _embedding_cache
+
+
+_inference_pool: Optional[InferencePool] = None
+_inference_pool_lock = threading.Lock()
+
+
+def _get_inference_pool() -> Optional[InferencePool]:
+    """Start the process pool on first use. Never from inside a pool worker."""
+    global _inference_pool
+    if _INFERENCE_PROCESSES <= 0 or _inference_worker or multiprocessing.parent_process() is not None:
+        return None
+    if _inference_pool is None:
+        with _inference_pool_lock:
+            if _inference_pool is None:
+                _inference_pool = InferencePool(_INFERENCE_PROCESSES)
+    return _inference_pool
+
+
+class _MatchStats:
+    """Thread-safe counters for one `match_faces` call."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._counts: Dict[str, int] = {}
+
+    def incr(self, key: str, n: int = 1) -> None:
+        with self._lock:
+            self._counts[key] = self._counts.get(key, 0) + n
+
+    def as_dict(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._counts)
+
+
+def batcher_stats() -> Dict[str, float]:
+    return _batcher.stats() if _batcher is not None else {}
+
+
 def extract_face_embedding(image_path: str) -> Optional[np.ndarray]:
     """Extract a 512-dim face embedding from a local image file."""
     try:
         print(f"[Face] Extracting embedding from: {image_path}")
-        result = _represent(image_path, enforce_detection=True)
-        if not result:
+        embedding = _embed(image_path)
+        if embedding is None:
             print("[Face] No face found in image")
             return None
-        embedding = np.array(result[0]["embedding"])
         print("[Face] Embedding extracted successfully (512-dim vector)")
         return embedding
     except Exception as e:
@@ -103,30 +307,272 @@ def extract_face_embedding(image_path: str) -> Optional[np.ndarray]:
         return None
 
 
-def _embedding_from_bytes(image_bytes: bytes) -> Optional[np.ndarray]:
-    """Write bytes to a per-worker temp file, extract embedding, clean up."""
-    tmp = tempfile.NamedTemporaryFile(suffix=".jpg", delete=False)
-    tmp_path = tmp.name
-    tmp.close()
+class _StageContext:
+    """Per-call state shared by the match pipeline stages."""
+
+    __slots__ = ("total", "stats", "near_dups")
+
+    def __init__(
+        self,
+        total: int = 0,
+        stats: Optional[_MatchStats] = None,
+        near_dups: Optional[NearDuplicateIndex] = None,
+    ) -> None:
+        self.total = total
+        self.stats = stats
+        self.near_dups = near_dups
+
+    def incr(self, key: str) -> None:
+        if self.stats is not None:
+            self.stats.incr(key)
+
+
+class _Candidate:
+    """
+    One search result moving through the match pipeline. Each stage fills in
+    the next field and clears the one it consumed, so queued candidates don't
+    pin raw bytes or full-size arrays. `done` is set once the embedding (or
+    its absence) is known; later stages pass done candidates straight on.
+    """
+
+    __slots__ = (
+        "idx", "result", "data", "image_hash", "rgb", "face",
+        "entry", "embedding", "perceptual_key", "done",
+    )
+
+    def __init__(
+        self,
+        idx: int,
+        result: Dict,
+        data: Optional[bytes] = None,
+        image_hash: Optional[str] = None,
+    ) -> None:
+        self.idx = idx
+        self.result = result
+        self.data = data
+        self.image_hash = image_hash
+        self.rgb: Optional[np.ndarray] = None
+        self.face: Optional[np.ndarray] = None
+        self.entry = None
+        self.embedding: Optional[np.ndarray] = None
+        self.perceptual_key: Optional[str] = None
+        self.done = False
+
+
+def _finish(
+    cand: _Candidate, embedding: Optional[np.ndarray], cacheable: bool
+) -> _Candidate:
+    """
+    Record the outcome for `cand`: wake near-duplicate waiters and, when
+    `cacheable` (False for unexpected, possibly transient errors), store it
+    in the persistent cache. Undecodable and faceless images are stored as
+    tombstones.
+    """
+    cand.embedding = embedding
+    cand.done = True
+    cand.data = cand.rgb = cand.face = None
+    if cand.entry is not None:
+        cand.entry.resolve(embedding)
+        cand.entry = None
+    cache = _get_embedding_cache() if cacheable and cand.image_hash else None
+    if cache is not None:
+        cache.put(cand.image_hash, embedding)
+    return cand
+
+
+def _check_cache(cand: _Candidate, ctx: _StageContext) -> _Candidate:
+    cache = _get_embedding_cache() if cand.image_hash else None
+    if cache is not None:
+        hit, cached = cache.get(cand.image_hash)
+        if hit:
+            ctx.incr("cache_hits")
+            cand.embedding = cached
+            cand.done = True
+            cand.data = None
+    return cand
+
+
+def _fetched(cand: _Candidate, ctx: _StageContext, data: Optional[bytes]) -> Optional[_Candidate]:
+    if not data:
+        print("  ✗ Could not fetch image")
+        ctx.incr("fetch_failed")
+        return None
+    cand.data = data
+    return cand
+
+
+def _announce(cand: _Candidate, ctx: _StageContext) -> None:
+    title = cand.result.get("title", "Unknown")
+    print(f"[Face Matching] Processing {cand.idx + 1}/{ctx.total}: {title[:60]}")
+
+
+def _known_failure(cand: _Candidate, ctx: _StageContext) -> bool:
+    """Skip URLs that failed recently without spending a connection."""
+    reason = known_failure(cand.result.get("url", ""))
+    if reason is None:
+        return False
+    print(f"  ✗ Skipped, failed recently ({reason})")
+    ctx.incr("known_failures")
+    return True
+
+
+def _fetch_deferred(cand: _Candidate, ctx: _StageContext) -> Future:
+    """
+    Start the download on the retry scheduler's pool; returns a Future for
+    the candidate (None if the fetch failed). Retries wait on the
+    scheduler's timer, so a flaky host never holds a thread asleep.
+    """
+    _announce(cand, ctx)
+    image_url = cand.result.get("url", "")
+    out: Future = Future()
+    if _known_failure(cand, ctx):
+        out.set_result(None)
+        return out
+    if not image_url.startswith("http"):
+        out.set_result(_fetched(cand, ctx, _load_bytes(image_url)))
+        return out
+
+    def done(fut: Future) -> None:
+        try:
+            data = fut.result()
+        except Exception as e:
+            print(f"[Face] Fetch error for {image_url}: {e}")
+            data = None
+        out.set_result(_fetched(cand, ctx, data))
+
+    fetch_image_bytes_with_resolve_deferred(
+        image_url, on_retry=lambda _delay, _reason: ctx.incr("fetch_retries")
+    ).add_done_callback(done)
+    return out
+
+
+async def _fetch_async(cand: _Candidate, ctx: _StageContext) -> Optional[_Candidate]:
+    """Same as `_fetch_deferred`, as a coroutine on the async fetch engine."""
+    _announce(cand, ctx)
+    if _known_failure(cand, ctx):
+        return None
+    return _fetched(cand, ctx, await _load_bytes_async(cand.result.get("url", "")))
+
+
+def _decode_stage(cand: _Candidate, ctx: _StageContext) -> _Candidate:
+    """Hash + cache lookup, then decode, claim a near-duplicate slot, and run
+    the cheap prefilter."""
+    if cand.done:
+        return cand
+    if cand.image_hash is None:
+        cand.image_hash = hashlib.sha256(cand.data).hexdigest()
+    if _check_cache(cand, ctx).done:
+        return cand
+    rgb = _decode_rgb(cand.data)
+    cand.data = None
+    if rgb is None:
+        return _finish(cand, None, True)
+
+    if ctx.near_dups is not None:
+        entry, owner = ctx.near_dups.claim(dhash(rgb))
+        cand.perceptual_key = entry.key
+        if not owner:
+            # The owner was claimed earlier and is already downstream, so
+            # blocking a decoder here cannot deadlock the pipeline.
+            entry.wait(timeout=_NEAR_DUP_WAIT_S)
+            ctx.incr("near_duplicates")
+            # Not cached: the dHash match is a per-request guess, and these
+            # bytes were never embedded themselves.
+            return _finish(cand, entry.embedding, False)
+        cand.entry = entry
+
+    if _PREFILTER_ENABLED and not has_face_candidate(rgb):
+        ctx.incr("prefilter_rejected")
+        # Not cached: a cascade miss would otherwise stick as "no face"
+        # after the prefilter is retuned or turned off.
+        return _finish(cand, None, False)
+    cand.rgb = rgb
+    return cand
+
+
+def _detect_stage(cand: _Candidate, ctx: _StageContext) -> _Candidate:
+    """
+    Detect and crop the face. With an inference pool (or without the
+    batcher) the whole detect + embed happens here in one call.
+    """
+    if cand.done:
+        return cand
+    rgb, cand.rgb = cand.rgb, None
+    pool = _get_inference_pool()
     try:
-        if not _prepare_image_file(image_bytes, tmp_path):
-            return None
-        result = _represent(tmp_path, enforce_detection=True)
-        if not result:
-            return None
-        return np.array(result[0]["embedding"])
+        if pool is not None:
+            embedding = pool.embed_rgb(rgb)
+        else:
+            # PIL gives RGB; DeepFace/OpenCV work in BGR.
+            bgr = np.ascontiguousarray(rgb[:, :, ::-1])
+            if _batcher is None:
+                embedding = _embed(bgr)
+            else:
+                face = _detect_face(bgr)
+                if face is None:
+                    ctx.incr("no_face")
+                    return _finish(cand, None, True)
+                cand.face = face
+                return cand
     except Exception as e:
-        # Quiet common "no face" case (DeepFace raises ValueError for it).
+        # The `_represent` fallback still signals "no face" by raising.
         msg = str(e)
-        if "Face could not be detected" in msg:
-            return None
-        print(f"[Face] Embedding error: {msg}")
-        return None
-    finally:
-        try:
-            os.remove(tmp_path)
-        except OSError:
-            pass
+        if "Face could not be detected" not in msg:
+            print(f"[Face] Embedding error: {msg}")
+            return _finish(cand, None, False)
+        embedding = None
+    ctx.incr("embedded" if embedding is not None else "no_face")
+    return _finish(cand, embedding, True)
+
+
+def _embed_stage(cand: _Candidate, ctx: _StageContext) -> _Candidate:
+    """Hand the crop to the micro-batcher and wait for its embedding."""
+    if cand.done:
+        return cand
+    face, cand.face = cand.face, None
+    try:
+        embedding = _batcher.embed(face)
+    except Exception as e:
+        print(f"[Face] Embedding error: {e}")
+        return _finish(cand, None, False)
+    ctx.incr("embedded")
+    return _finish(cand, embedding, True)
+
+
+def _embed_candidate(
+    image_bytes: bytes,
+    image_hash: Optional[str] = None,
+    stats: Optional[_MatchStats] = None,
+    near_dups: Optional[NearDuplicateIndex] = None,
+) -> Tuple[Optional[np.ndarray], Optional[str]]:
+    """
+    Run one already-downloaded image through the decode/detect/embed stages
+    inline. Returns `(embedding, perceptual_key)`; the key identifies the
+    near-duplicate group when `near_dups` is given.
+
+    The persistent cache (keyed by `image_hash`, computed if not given) is
+    consulted first and updated afterwards, unless the image was a near
+    duplicate that reused another candidate's embedding.
+    """
+    ctx = _StageContext(stats=stats, near_dups=near_dups)
+    cand = _Candidate(0, {}, image_bytes, image_hash)
+    try:
+        for stage in (_decode_stage, _detect_stage, _embed_stage):
+            cand = stage(cand, ctx)
+    except Exception as e:
+        print(f"[Face] Embedding error: {e}")
+        _finish(cand, None, False)
+    return cand.embedding, cand.perceptual_key
+
+
+def _embedding_from_bytes(
+    image_bytes: bytes,
+    image_hash: Optional[str] = None,
+    stats: Optional[_MatchStats] = None,
+) -> Optional[np.ndarray]:
+    """Decode bytes in memory and extract an embedding (cache-aware)."""
+    embedding, _ = _embed_candidate(image_bytes, image_hash, stats)
+    return embedding
 
 
 def extract_face_embedding_from_url(image_url: str) -> Optional[np.ndarray]:
@@ -139,7 +585,7 @@ def extract_face_embedding_from_url(image_url: str) -> Optional[np.ndarray]:
         else:
             with open(image_url, "rb") as f:
                 data = f.read()
-        return _embedding_from_bytes(data)
+        return _embedding_from_bytes(data, hashlib.sha256(data).hexdigest())
     except Exception as e:
         print(f"[Face] Error extracting face from URL {image_url}: {e}")
         return None
@@ -160,10 +606,55 @@ def compare_faces(
         return False, 1.0
 
 
+def _normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float64))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def score_embeddings(
+    references: np.ndarray, candidates: np.ndarray, aggregate: str = "min"
+) -> np.ndarray:
+    """
+    Cosine distance of every candidate to a set of reference embeddings.
+
+    `references` is `(R, D)` (or a single `(D,)` vector), `candidates` is
+    `(M, D)`. All pairs are scored with one normalized matrix product, then
+    each candidate's R distances are reduced with `aggregate`: "min" (closest
+    enrolled photo wins) or "mean". Returns an `(M,)` array.
+    """
+    refs = _normalize_rows(references)
+    cands = _normalize_rows(candidates)
+    distances = 1.0 - cands @ refs.T  # (M, R)
+    if aggregate == "mean":
+        return distances.mean(axis=1)
+    if aggregate != "min":
+        raise ValueError(f"Unknown aggregate: {aggregate}")
+    return distances.min(axis=1)
+
+
+def extract_reference_embeddings(image_paths: List[str]) -> Optional[np.ndarray]:
+    """Embed each enrolled photo; returns an `(R, 512)` matrix of the ones
+    that contained a face, or None if none did."""
+    embeddings = []
+    for path in image_paths:
+        emb = extract_face_embedding(path)
+        if emb is not None:
+            embeddings.append(emb)
+    if not embeddings:
+        return None
+    return np.vstack(embeddings)
+
+
 def _load_bytes(image_source: str) -> Optional[bytes]:
     """Unified byte loader - handles URLs (with social resolution) and local paths."""
     try:
         if image_source.startswith("http"):
+            reason = known_failure(image_source)
+            if reason is not None:
+                print(f"[Face] Skipping {image_source}: failed recently ({reason})")
+                return None
             return fetch_image_bytes_with_resolve(image_source)
         with open(image_source, "rb") as f:
             return f.read()
@@ -172,76 +663,203 @@ def _load_bytes(image_source: str) -> Optional[bytes]:
         return None
 
 
-def _process_one(
-    idx: int,
-    total: int,
-    user_embedding: np.ndarray,
-    result: Dict,
-    threshold: float,
-) -> Optional[Dict]:
-    image_url = result.get("url", "")
-    title = result.get("title", "Unknown")
-    print(f"[Face Matching] Processing {idx + 1}/{total}: {title[:60]}")
-
-    data = _load_bytes(image_url)
-    if not data:
-        print("  ✗ Could not fetch image")
-        return None
-
-    embedding = _embedding_from_bytes(data)
-    if embedding is None:
-        print("  ✗ No face detected")
+async def _load_bytes_async(image_source: str) -> Optional[bytes]:
+    """`_load_bytes` for the async fetch engine; runs on its event loop."""
+    try:
+        if image_source.startswith("http"):
+            return await fetch_image_bytes_with_resolve_async(image_source)
+        with open(image_source, "rb") as f:
+            return f.read()
+    except Exception as e:
+        print(f"[Face] Fetch error for {image_source}: {e}")
         return None
 
-    is_match, distance = compare_faces(user_embedding, embedding, threshold)
-    similarity = float(1 - (distance / 2))
-    if not is_match:
-        print(f"  ✗ Not a match (distance: {distance:.3f}, needed: < {threshold})")
-        return None
 
-    img_hash = hashlib.sha256(data).hexdigest()
-    print(f"  ✓ MATCH FOUND! Distance: {distance:.3f}, Similarity: {similarity:.1%}")
+def _fetch_stage_for(ctx: _StageContext) -> Tuple[Stage, str]:
+    """The pipeline's fetch stage: coroutines on the shared async engine when
+    it is enabled and available, otherwise fetches on the retry scheduler's
+    thread pool. Either way the stage itself holds no thread per download."""
+    fetcher = get_fetcher() if _FETCH_ENGINE == "async" else None
+    if fetcher is not None:
+        stage = Stage(
+            "fetch",
+            lambda cand: fetcher.submit(_fetch_async(cand, ctx)),
+            maxsize=_STAGE_QUEUE_SIZE,
+            max_inflight=fetcher.max_inflight,
+        )
+        return stage, "async"
+    stage = Stage(
+        "fetch",
+        partial(_fetch_deferred, ctx=ctx),
+        maxsize=_STAGE_QUEUE_SIZE,
+        max_inflight=_FETCH_WORKERS,
+    )
+    return stage, "threads"
+
+
+def _build_match(item: Tuple[Dict, np.ndarray, str, Optional[str]], distance: float) -> Dict:
+    result, _, img_hash, perceptual_key = item
+    image_url = result.get("url", "")
     return {
         "url": image_url,
         "page_url": result.get("page_url", image_url),
-        "title": title,
+        "title": result.get("title", "Unknown"),
         "source": result.get("source", "Unknown"),
-        "similarity_score": similarity,
+        "similarity_score": float(1 - (distance / 2)),
         "distance": float(distance),
         "image_hash": img_hash,
+        "perceptual_hash": perceptual_key,
     }
 
 
 def match_faces(
     user_embedding: np.ndarray,
-    search_results: List[Dict],
+    search_results: Iterable[Dict],
     threshold: float = 0.5,
+    aggregate: str = "min",
+    stats: Optional[Dict] = None,
+    max_matches: Optional[int] = None,
+    strong_match_distance: Optional[float] = None,
+    time_budget_s: Optional[float] = None,
+    on_progress: Optional[Callable[[int, int], None]] = None,
+    on_match: Optional[Callable[[Dict], None]] = None,
 ) -> List[Dict]:
     """
-    Compare the user's face against each candidate. I/O (download) and
-    CPU-bound embedding extraction run on a thread pool; DeepFace inference
-    itself is serialized by `_model_lock` to play nice with Keras.
+    Compare the user's face(s) against each candidate.
+
+    Candidates flow through a staged pipeline (see staged_pipeline.py):
+    fetch (async coroutines, or many I/O threads) -> decode + prefilter ->
+    face detection -> embedding, with bounded queues in between so a slow
+    download never holds up decoding and inference is fed while the network
+    is busy. The Facenet512 forward passes are micro-batched by `_batcher`.
+
+    `user_embedding` may be a single `(512,)` vector or an `(R, 512)` matrix
+    of several enrolled photos; see `score_embeddings` for `aggregate`. All
+    candidates are scored in one matrix product once embedding is done.
+
+    Candidates enter the pipeline in list order, so callers should pass them
+    in priority order. `search_results` may also be an iterator that yields
+    candidates as they become available (e.g. while some searches are still
+    running); matching then starts on the first one and runs until the
+    iterator is exhausted, and `total` below counts candidates received so
+    far. Matching stops early once `max_matches` candidates
+    scored under `strong_match_distance` (default: 0.7 * threshold), or once
+    `time_budget_s` has elapsed; queued candidates are then abandoned and
+    in-flight stage workers are not waited for.
+
+    `on_progress(done, total)` is called as each candidate finishes and
+    `on_match(match)` as soon as a candidate scores under `threshold`, so
+    callers can stream results before the whole batch is done.
+
+    If `stats` is given it is filled with per-call counters (cache hits,
+    prefilter rejections, fetch failures, ...), per-stage queue stats and
+    batcher stats.
     """
-    total = len(search_results)
-    print(f"\n[Face Matching] Starting to match {total} images with {_MAX_WORKERS} workers...")
-    print(f"[Face Matching] Threshold: {threshold} (lower = stricter matching)")
+    streaming = not isinstance(search_results, Sized)
+    total = 0 if streaming else len(search_results)
+    references = np.atleast_2d(user_embedding)
+    print(
+        f"[Face Matching] Threshold: {threshold} (lower = stricter matching), "
+        f"{len(references)} reference photo(s), aggregate={aggregate}"
+    )
+
+    if strong_match_distance is None:
+        strong_match_distance = threshold * 0.7
+    deadline = time.monotonic() + time_budget_s if time_budget_s else None
+
+    counters = _MatchStats()
+    near_dups = NearDuplicateIndex(_NEAR_DUP_MAX_DISTANCE) if _NEAR_DUP_MAX_DISTANCE >= 0 else None
+    ctx = _StageContext(total, counters, near_dups)
+    fetch_stage, fetch_engine = _fetch_stage_for(ctx)
+    pipeline = StagedPipeline(
+        [
+            fetch_stage,
+            Stage("decode", partial(_decode_stage, ctx=ctx), _DECODE_WORKERS, _STAGE_QUEUE_SIZE),
+            Stage("detect", partial(_detect_stage, ctx=ctx), _DETECT_WORKERS, _STAGE_QUEUE_SIZE),
+            Stage("embed", partial(_embed_stage, ctx=ctx), _EMBED_WORKERS, _STAGE_QUEUE_SIZE),
+        ],
+        on_error=lambda cand, _e: _finish(cand, None, False),
+        name="match",
+    )
+    print(
+        f"\n[Face Matching] Starting to match {'streamed' if streaming else total} images "
+        f"(fetch={fetch_engine}:{fetch_stage.max_inflight or fetch_stage.workers}, "
+        f"decode={_DECODE_WORKERS}, detect={_DETECT_WORKERS}, embed={_EMBED_WORKERS})..."
+    )
+    stop_reason: Optional[str] = None
+    strong = 0
+    done = 0
+    embedded: List[Tuple[Dict, np.ndarray, str, Optional[str]]] = []
+    def _feed() -> Iterator[_Candidate]:
+        for i, res in enumerate(search_results):
+            if streaming:
+                ctx.total = i + 1
+            yield _Candidate(i, res)
+
+    pipeline.start(_feed())
+    try:
+        try:
+            for _, cand in pipeline.results(deadline):
+                done += 1
+                if on_progress is not None:
+                    on_progress(done, ctx.total)
+                if cand.embedding is None:
+                    if cand.done:
+                        print(f"  ✗ No face detected: {cand.result.get('title', 'Unknown')[:60]}")
+                    continue
+                item = (cand.result, cand.embedding, cand.image_hash, cand.perceptual_key)
+                embedded.append(item)
+                if max_matches or on_match is not None:
+                    distance = float(score_embeddings(references, item[1], aggregate=aggregate)[0])
+                    if on_match is not None and distance < threshold:
+                        on_match(_build_match(item, distance))
+                    if max_matches and distance < strong_match_distance:
+                        strong += 1
+                        if strong >= max_matches:
+                            stop_reason = "match_budget"
+                            break
+        except TimeoutError:
+            stop_reason = "time_budget"
+    finally:
+        pipeline.stop()
+        if stop_reason:
+            if near_dups is not None:
+                near_dups.release_pending()
+            cancelled = ctx.total - done
+            counters.incr("cancelled", cancelled)
+            print(f"[Face Matching] Stopping early ({stop_reason}); abandoned {cancelled} candidate(s)")
 
     matches: List[Dict] = []
-    with ThreadPoolExecutor(max_workers=_MAX_WORKERS) as pool:
-        futures = {
-            pool.submit(_process_one, i, total, user_embedding, res, threshold): i
-            for i, res in enumerate(search_results)
-        }
-        for fut in as_completed(futures):
-            try:
-                m = fut.result()
-            except Exception as e:
-                print(f"[Face Matching] Worker error: {e}")
+    if embedded:
+        candidates = np.vstack([emb for _, emb, _, _ in embedded])
+        distances = score_embeddings(references, candidates, aggregate=aggregate)
+        for item, distance in zip(embedded, distances):
+            distance = float(distance)
+            title = item[0].get("title", "Unknown")
+            if distance >= threshold:
+                print(f"  ✗ Not a match: {title[:60]} (distance: {distance:.3f}, needed: < {threshold})")
                 continue
-            if m is not None:
-                matches.append(m)
+            match = _build_match(item, distance)
+            print(
+                f"  ✓ MATCH FOUND! {title[:60]} Distance: {distance:.3f}, "
+                f"Similarity: {match['similarity_score']:.1%}"
+            )
+            matches.append(match)
 
     matches.sort(key=lambda x: x["similarity_score"], reverse=True)
+    counts = counters.as_dict()
+    if counts.get("prefilter_rejected"):
+        print(f"[Face Matching] Prefilter skipped {counts['prefilter_rejected']} no-face candidate(s)")
+    if stats is not None:
+        stats.update(counts)
+        stats["fetch_engine"] = fetch_engine
+        stats["stages"] = pipeline.stats()
+        stats["retries"] = retry_stats()
+        stats["http_cache"] = http_cache_stats()
+        stats["negative_cache"] = negative_cache_stats()
+        stats["resolve_cache"] = resolve_cache_stats()
+        stats["batcher"] = batcher_stats()
+        stats["stopped_early"] = stop_reason
     print(f"\n[Face Matching] Complete! Found {len(matches)} matching images\n")
     return matches
 
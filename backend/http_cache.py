@@ -0,0 +1,228 @@
+"""
+On-disk cache of downloaded image bytes with conditional revalidation.
+
+Why: every `/upload` re-downloaded every candidate, although many image URLs
+recur across users and across rescans of the same user. Bandwidth and
+download latency are our largest per-request costs after inference.
+
+- Entries are keyed by the final URL (after redirects); the requested URL is
+  recorded as an alias so the next lookup finds it without a request.
+- Bodies are stored content-addressed (`<dir>/blobs/ab/abcd...`), so the same
+  bytes served under several URLs are kept once.
+- Within `ttl_s` of the last validation an entry is served straight from
+  disk. After that the caller revalidates with `If-None-Match` /
+  `If-Modified-Since`; a 304 refreshes the entry without a body transfer.
+- Size-based LRU over the stored bodies, like embedding_cache.py. SQLite in
+  WAL mode holds the index so several gunicorn workers can share it.
+
+Only image responses are cached: HTML landing pages vary with the
+User-Agent we send, and are cheap compared to the images they point to.
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, NamedTuple, Optional
+
+
+class CachedResponse(NamedTuple):
+    url: str
+    body: bytes
+    content_type: str
+    etag: Optional[str]
+    last_modified: Optional[str]
+    fresh: bool
+
+    def conditional_headers(self) -> Dict[str, str]:
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class HttpCache:
+    def __init__(self, directory: str, max_bytes: int, ttl_s: float) -> None:
+        self._dir = directory
+        self._blob_dir = os.path.join(directory, "blobs")
+        self._max_bytes = max(0, int(max_bytes))
+        self._ttl_s = ttl_s
+        self._lock = threading.Lock()
+        self._counts = {"hits": 0, "revalidated": 0, "misses": 0, "stored": 0, "evicted": 0}
+
+        os.makedirs(self._blob_dir, exist_ok=True)
+        self._conn = sqlite3.connect(
+            os.path.join(directory, "index.sqlite3"), check_same_thread=False, timeout=10
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                url TEXT PRIMARY KEY,
+                sha TEXT NOT NULL,
+                content_type TEXT NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                validated_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS responses_last_used ON responses(last_used);
+            CREATE INDEX IF NOT EXISTS responses_sha ON responses(sha);
+            CREATE TABLE IF NOT EXISTS aliases (
+                url TEXT PRIMARY KEY,
+                final_url TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS blobs (
+                sha TEXT PRIMARY KEY,
+                nbytes INTEGER NOT NULL
+            );
+            """
+        )
+        self._conn.commit()
+        row = self._conn.execute("SELECT COALESCE(SUM(nbytes), 0) FROM blobs").fetchone()
+        self._total_bytes = int(row[0])
+
+    def _blob_path(self, sha: str) -> str:
+        return os.path.join(self._blob_dir, sha[:2], sha)
+
+    def lookup(self, url: str) -> Optional[CachedResponse]:
+        """Cached response for `url` (requested or final), or None."""
+        try:
+            with self._lock:
+                alias = self._conn.execute(
+                    "SELECT final_url FROM aliases WHERE url = ?", (url,)
+                ).fetchone()
+                final_url = alias[0] if alias else url
+                row = self._conn.execute(
+                    "SELECT sha, content_type, etag, last_modified, validated_at "
+                    "FROM responses WHERE url = ?",
+                    (final_url,),
+                ).fetchone()
+                if row is None:
+                    self._counts["misses"] += 1
+                    return None
+                self._conn.execute(
+                    "UPDATE responses SET last_used = ? WHERE url = ?", (time.time(), final_url)
+                )
+                self._conn.commit()
+        except sqlite3.Error as e:
+            print(f"[HttpCache] Read error: {e}")
+            return None
+        sha, content_type, etag, last_modified, validated_at = row
+        try:
+            with open(self._blob_path(sha), "rb") as f:
+                body = f.read()
+        except OSError:
+            # Blob removed behind our back; treat as a miss.
+            with self._lock:
+                self._counts["misses"] += 1
+            return None
+        fresh = time.time() - validated_at < self._ttl_s
+        if fresh:
+            with self._lock:
+                self._counts["hits"] += 1
+        return CachedResponse(final_url, body, content_type, etag, last_modified, fresh)
+
+    def store(
+        self,
+        url: str,
+        final_url: str,
+        body: bytes,
+        content_type: str,
+        etag: Optional[str],
+        last_modified: Optional[str],
+    ) -> None:
+        sha = hashlib.sha256(body).hexdigest()
+        path = self._blob_path(sha)
+        try:
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(tmp, "wb") as f:
+                    f.write(body)
+                os.replace(tmp, path)
+        except OSError as e:
+            print(f"[HttpCache] Write error: {e}")
+            return
+        now = time.time()
+        try:
+            with self._lock:
+                known = self._conn.execute("SELECT 1 FROM blobs WHERE sha = ?", (sha,)).fetchone()
+                if known is None:
+                    self._conn.execute(
+                        "INSERT INTO blobs (sha, nbytes) VALUES (?, ?)", (sha, len(body))
+                    )
+                    self._total_bytes += len(body)
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO responses "
+                    "(url, sha, content_type, etag, last_modified, validated_at, last_used) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (final_url, sha, content_type, etag, last_modified, now, now),
+                )
+                if url != final_url:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO aliases (url, final_url) VALUES (?, ?)",
+                        (url, final_url),
+                    )
+                self._counts["stored"] += 1
+                if self._max_bytes and self._total_bytes > self._max_bytes:
+                    self._evict_locked()
+                self._conn.commit()
+        except sqlite3.Error as e:
+            print(f"[HttpCache] Write error: {e}")
+
+    def revalidated(
+        self, cached: CachedResponse, etag: Optional[str], last_modified: Optional[str]
+    ) -> None:
+        """Record a 304 for `cached`, picking up any new validators."""
+        try:
+            with self._lock:
+                self._conn.execute(
+                    "UPDATE responses SET validated_at = ?, etag = ?, last_modified = ? "
+                    "WHERE url = ?",
+                    (
+                        time.time(),
+                        etag or cached.etag,
+                        last_modified or cached.last_modified,
+                        cached.url,
+                    ),
+                )
+                self._conn.commit()
+                self._counts["revalidated"] += 1
+        except sqlite3.Error as e:
+            print(f"[HttpCache] Write error: {e}")
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self._counts, "bytes": self._total_bytes}
+
+    def _evict_locked(self) -> None:
+        # Evict down to 90% so we don't run an eviction on every insert.
+        target = int(self._max_bytes * 0.9)
+        rows = self._conn.execute(
+            "SELECT url, sha FROM responses ORDER BY last_used ASC"
+        ).fetchall()
+        for url, sha in rows:
+            if self._total_bytes <= target:
+                break
+            self._conn.execute("DELETE FROM responses WHERE url = ?", (url,))
+            self._conn.execute("DELETE FROM aliases WHERE final_url = ?", (url,))
+            self._counts["evicted"] += 1
+            still_used = self._conn.execute(
+                "SELECT 1 FROM responses WHERE sha = ? LIMIT 1", (sha,)
+            ).fetchone()
+            if still_used:
+                continue
+            blob = self._conn.execute("SELECT nbytes FROM blobs WHERE sha = ?", (sha,)).fetchone()
+            self._conn.execute("DELETE FROM blobs WHERE sha = ?", (sha,))
+            if blob:
+                self._total_bytes -= int(blob[0])
+            try:
+                os.remove(self._blob_path(sha))
+            except OSError:
+                pass
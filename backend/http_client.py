@@ -5,14 +5,34 @@ Motivation: many image hosts (LinkedIn CDN, Evie, Instagram CDN, etc.) reject
 requests whose User-Agent looks like Python/urllib. A single configured
 `requests.Session` with a modern Chrome UA fixes the majority of 403s we saw
 in production, and lets us layer on retries + content-type filtering.
+
+Connection reuse: a few CDNs (fbcdn, cdninstagram, licdn) serve most of our
+candidates, and requests' default adapter keeps only 10 connections per host,
+so concurrent fetches kept discarding and re-handshaking connections. The
+session's adapter sizes each host's keep-alive pool from a per-host limit,
+and `HostGovernor` caps concurrent fetches per host at that same limit, so a
+fetch always finds a pooled connection. A 429/503 with `Retry-After` puts the
+host on cooldown for every thread, instead of each one hammering it again.
 """
 from __future__ import annotations
 
+import os
+import re
+import threading
 import time
-from typing import Optional, Tuple
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from typing import Dict, Iterator, Optional, Tuple
 from urllib.parse import urlsplit
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.poolmanager import PoolManager
+
+from http_cache import CachedResponse, HttpCache
+from image_sniff import HeaderSniffer
+from negative_cache import NegativeCache
+from retry_scheduler import RetryLater, backoff_delay, get_scheduler
 
 
 CHROME_UA = (
@@ -38,19 +58,301 @@ DEFAULT_TIMEOUT: Tuple[float, float] = (6.0, 10.0)
 # slow down embedding with no benefit. 20 MB is generous.
 MAX_RESPONSE_BYTES = 20 * 1024 * 1024
 
+# Transient statuses worth retrying. Shared with the async engine in
+# async_fetch.py; the backoff policy itself is `retry_scheduler.backoff_delay`.
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+# Longest Retry-After we are willing to wait out. A host asking for more is
+# put on cooldown for this long and the fetch gives up.
+MAX_RETRY_AFTER_S = float(os.environ.get("HTTP_MAX_RETRY_AFTER_S", "30"))
+
+# Per-host limit: concurrent fetches and keep-alive pool size. Hosts match by
+# domain suffix; HTTP_HOST_LIMITS ("fbcdn.net=32,licdn.com=16") adds to or
+# overrides the built-in table, HTTP_HOST_LIMIT applies to everything else.
+DEFAULT_HOST_LIMIT = int(os.environ.get("HTTP_HOST_LIMIT", "8"))
+_BUILTIN_HOST_LIMITS = {
+    "fbcdn.net": 24,
+    "cdninstagram.com": 24,
+    "licdn.com": 16,
+    "twimg.com": 16,
+}
+# How many distinct hosts keep a connection pool at once.
+POOL_HOSTS = int(os.environ.get("HTTP_POOL_HOSTS", "64"))
+
+
+def _parse_host_limits(spec: str) -> Dict[str, int]:
+    limits: Dict[str, int] = {}
+    for part in spec.split(","):
+        domain, _, value = part.partition("=")
+        domain = domain.strip().lower().lstrip(".")
+        try:
+            limits[domain] = int(value)
+        except ValueError:
+            continue
+    return limits
+
+
+_HOST_LIMITS = {**_BUILTIN_HOST_LIMITS, **_parse_host_limits(os.environ.get("HTTP_HOST_LIMITS", ""))}
+
+
+def host_limit(host: str) -> int:
+    """Per-host limit for `host`, by longest matching domain suffix."""
+    host = (host or "").lower()
+    best, best_len = DEFAULT_HOST_LIMIT, -1
+    for domain, limit in _HOST_LIMITS.items():
+        if (host == domain or host.endswith("." + domain)) and len(domain) > best_len:
+            best, best_len = limit, len(domain)
+    return max(1, best)
+
+
+def _host_of(url: str) -> str:
+    try:
+        return (urlsplit(url).hostname or "").lower()
+    except Exception:
+        return ""
+
+
+class _HostPoolManager(PoolManager):
+    """PoolManager whose per-host connection pools are sized by `host_limit`."""
+
+    def _new_pool(self, scheme, host, port, request_context=None):
+        if request_context is None:
+            request_context = self.connection_pool_kw.copy()
+        request_context = dict(request_context)
+        request_context["maxsize"] = host_limit(host)
+        return super()._new_pool(scheme, host, port, request_context)
+
+
+class HostPoolAdapter(HTTPAdapter):
+    def init_poolmanager(self, connections, maxsize, block=False, **pool_kwargs):
+        self._pool_connections = connections
+        self._pool_maxsize = maxsize
+        self._pool_block = block
+        self.poolmanager = _HostPoolManager(
+            num_pools=connections, maxsize=maxsize, block=block, **pool_kwargs
+        )
+
+
+class HostGovernor:
+    """
+    Caps concurrent requests per host at `host_limit(host)` and holds a
+    per-host cooldown set from `Retry-After`. Thread-safe.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._semaphores: Dict[str, threading.BoundedSemaphore] = {}
+        self._cooldown_until: Dict[str, float] = {}
+        self._counts = {"throttled": 0, "cooldown_waits": 0, "busy_deferrals": 0}
+
+    def _semaphore(self, host: str) -> threading.BoundedSemaphore:
+        with self._lock:
+            sem = self._semaphores.get(host)
+            if sem is None:
+                sem = threading.BoundedSemaphore(host_limit(host))
+                self._semaphores[host] = sem
+            return sem
+
+    def cooldown_remaining(self, host: str) -> float:
+        with self._lock:
+            until = self._cooldown_until.get(host)
+            if until is None:
+                return 0.0
+            remaining = until - time.monotonic()
+            if remaining <= 0:
+                del self._cooldown_until[host]
+                return 0.0
+            self._counts["cooldown_waits"] += 1
+            return remaining
+
+    def cool_down(self, host: str, seconds: float) -> None:
+        with self._lock:
+            until = time.monotonic() + min(seconds, MAX_RETRY_AFTER_S)
+            if until > self._cooldown_until.get(host, 0.0):
+                self._cooldown_until[host] = until
+            self._counts["throttled"] += 1
+
+    @contextmanager
+    def slot(self, host: str, wait: bool = True) -> Iterator[None]:
+        """
+        Wait out any cooldown, then hold one of the host's request slots.
+        With `wait=False` it raises `RetryLater(attempted=False)` instead of
+        waiting for either, so deferred fetches never park a pool thread.
+        """
+        cooldown = self.cooldown_remaining(host)
+        if cooldown:
+            if not wait:
+                raise RetryLater("host cooldown", cooldown, attempted=False)
+            time.sleep(cooldown)
+        sem = self._semaphore(host)
+        if not sem.acquire(blocking=wait):
+            with self._lock:
+                self._counts["busy_deferrals"] += 1
+            raise RetryLater("host busy", backoff_delay(0), attempted=False)
+        try:
+            yield
+        finally:
+            sem.release()
+
+    def stats(self) -> Dict[str, object]:
+        now = time.monotonic()
+        with self._lock:
+            return {
+                **self._counts,
+                "hosts": len(self._semaphores),
+                "cooling_down": sorted(h for h, t in self._cooldown_until.items() if t > now),
+            }
+
+
+_governor = HostGovernor()
+
+
+def governor_stats() -> Dict[str, object]:
+    return _governor.stats()
+
+
+# Recent failures (see negative_cache.py): fetches of a known-bad URL or host
+# return None without touching the network.
+_negative_cache = NegativeCache()
+
+
+def known_failure(url: str) -> Optional[str]:
+    """Why `url` failed recently (URL- or host-level), or None."""
+    return _negative_cache.check(url, _host_of(url))
+
+
+def known_permanent_failure(url: str) -> Optional[str]:
+    """Why `url` itself failed permanently recently (4xx, not an image, ...), or None."""
+    return _negative_cache.permanent(url)
+
+
+def remember_failure(url: str, reason: str, transient: bool = False) -> None:
+    _negative_cache.record(url, _host_of(url), reason, transient=transient)
+
+
+def _remember_status(url: str, status: int) -> None:
+    # 4xx won't change on retry; anything else non-200 here is unusual
+    # enough that we'd rather try again next time.
+    if 400 <= status < 500:
+        remember_failure(url, f"http {status}")
+
+
+def _remember_content_type(url: str, content_type: str) -> None:
+    # HTML is only "wrong" for callers that didn't ask for it; the social
+    # resolver may still want the same page for its og:image.
+    if content_type not in ("text/html", "application/xhtml+xml"):
+        remember_failure(url, f"content-type {content_type or '<none>'}")
+
+
+def negative_cache_stats() -> Dict[str, int]:
+    return _negative_cache.stats()
+
+
+# On-disk cache of image responses (see http_cache.py): entries younger than
+# HTTP_CACHE_TTL_S are served from disk, older ones are revalidated with a
+# conditional GET. An empty HTTP_CACHE_DIR disables it.
+HTTP_CACHE_DIR = os.environ.get("HTTP_CACHE_DIR", "cache/http")
+HTTP_CACHE_MAX_MB = int(os.environ.get("HTTP_CACHE_MAX_MB", "1024"))
+HTTP_CACHE_TTL_S = float(os.environ.get("HTTP_CACHE_TTL_S", "86400"))
+
+_http_cache: Optional[HttpCache] = None
+_http_cache_failed = False
+_http_cache_lock = threading.Lock()
+
+
+def _get_http_cache() -> Optional[HttpCache]:
+    """Open the cache on first use, so processes that never fetch don't."""
+    global _http_cache, _http_cache_failed
+    if _http_cache is None and HTTP_CACHE_DIR and not _http_cache_failed:
+        with _http_cache_lock:
+            if _http_cache is None and not _http_cache_failed:
+                try:
+                    _http_cache = HttpCache(
+                        HTTP_CACHE_DIR,
+                        max_bytes=HTTP_CACHE_MAX_MB * 1024 * 1024,
+                        ttl_s=HTTP_CACHE_TTL_S,
+                    )
+                except Exception as e:
+                    _http_cache_failed = True
+                    print(f"[HTTP] Warning: response cache disabled ({e})")
+    return _http_cache
+
+
+def _cache_lookup(url: str) -> Optional[CachedResponse]:
+    cache = _get_http_cache()
+    return cache.lookup(url) if cache is not None else None
+
+
+def _cache_store(url: str, final_url: str, result: Tuple[bytes, str], headers) -> None:
+    body, content_type = result
+    cache = _get_http_cache()
+    if cache is None or not content_type.startswith("image/"):
+        return
+    cache.store(
+        url, final_url, body, content_type, headers.get("ETag"), headers.get("Last-Modified")
+    )
+
+
+def _cache_revalidated(cached: CachedResponse, headers) -> Tuple[bytes, str]:
+    cache = _get_http_cache()
+    if cache is not None:
+        cache.revalidated(cached, headers.get("ETag"), headers.get("Last-Modified"))
+    return cached.body, cached.content_type
+
+
+def http_cache_stats() -> Dict[str, int]:
+    return _http_cache.stats() if _http_cache is not None else {}
+
 
 _session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
 
 
 def get_session() -> requests.Session:
     global _session
     if _session is None:
-        s = requests.Session()
-        s.headers.update(DEFAULT_HEADERS)
-        _session = s
+        with _session_lock:
+            if _session is None:
+                s = requests.Session()
+                s.headers.update(DEFAULT_HEADERS)
+                adapter = HostPoolAdapter(pool_connections=POOL_HOSTS, pool_maxsize=DEFAULT_HOST_LIMIT)
+                s.mount("https://", adapter)
+                s.mount("http://", adapter)
+                _session = s
     return _session
 
 
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Retry-After as seconds (delta-seconds or HTTP-date), or None."""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except Exception:
+        return None
+
+
+def _retry_after_hint(host: str, status: int, retry_after: Optional[str]) -> Optional[float]:
+    """
+    Seconds a 429/503 asked us to wait via `Retry-After`, or None. Rate
+    limits put the host on cooldown for every caller.
+    """
+    if status not in (429, 503):
+        return None
+    hinted = parse_retry_after(retry_after)
+    if hinted is not None:
+        _governor.cool_down(host, hinted)
+    elif status == 429:
+        _governor.cool_down(host, backoff_delay(0))
+    return hinted
+
+
 def _infer_referer(url: str) -> Optional[str]:
     """Pick a sensible Referer so picky CDNs serve the asset."""
     try:
@@ -70,6 +372,27 @@ def _infer_referer(url: str) -> Optional[str]:
     return None
 
 
+def _request_headers(
+    url: str, referer: Optional[str], user_agent: Optional[str]
+) -> Dict[str, str]:
+    """Per-request headers layered over the session defaults."""
+    headers = {}
+    if user_agent:
+        headers["User-Agent"] = user_agent
+    ref = referer or _infer_referer(url)
+    if ref:
+        headers["Referer"] = ref
+    return headers
+
+
+def _accepted_content_type(header: Optional[str], allow_html: bool) -> Tuple[str, bool]:
+    """Normalize a Content-Type header; returns `(content_type, acceptable)`."""
+    content_type = (header or "").split(";")[0].strip().lower()
+    is_image = content_type.startswith("image/")
+    is_html = content_type in ("text/html", "application/xhtml+xml")
+    return content_type, is_image or (allow_html and is_html)
+
+
 def fetch_bytes(
     url: str,
     *,
@@ -77,80 +400,179 @@ def fetch_bytes(
     allow_html: bool = False,
     max_retries: int = 2,
     user_agent: Optional[str] = None,
+    defer_retries: bool = False,
+    stop_at: Optional[re.Pattern] = None,
 ) -> Optional[Tuple[bytes, str]]:
     """
     Download a URL and return `(bytes, content_type)`.
 
     - Adds a Referer header automatically for known picky CDNs.
-    - Retries with backoff on transient network errors and 429/5xx responses.
+    - Retries with jittered exponential backoff on transient network errors
+      and 429/5xx responses, honoring `Retry-After`. With
+      `defer_retries=True` it makes one attempt and raises `RetryLater`
+      instead of sleeping, so the caller can reschedule (see
+      retry_scheduler.py).
+    - Runs inside the host's `HostGovernor` slot. With `defer_retries=True`
+      a host that is cooling down or has no free slot raises `RetryLater`
+      too, without sending anything.
+    - Serves images from the on-disk response cache while fresh and
+      revalidates stale entries with a conditional GET.
+    - Skips URLs and hosts that failed recently, and records new failures
+      (see negative_cache.py).
+    - Aborts image downloads early when the header shows the image is too
+      small or too large to be useful, or isn't an image at all.
     - By default, rejects non-image content types. Set `allow_html=True` when
       the caller (e.g. the social resolver) wants to parse an HTML landing
       page for an og:image tag.
     - `user_agent` overrides the session default; useful when sites only
       serve SEO-friendly HTML to known search-engine crawlers.
+    - `stop_at` (a bytes regex) ends the read of a non-image body as soon as
+      it matches; the body is cut just after the match and the rest of the
+      response is never downloaded.
     - Returns `None` on permanent failure (404, 403 after retries, wrong
       content type, oversized response).
     """
+    if known_failure(url) is not None:
+        return None
     session = get_session()
-    headers = {}
-    if user_agent:
-        headers["User-Agent"] = user_agent
-    ref = referer or _infer_referer(url)
-    if ref:
-        headers["Referer"] = ref
+    headers = _request_headers(url, referer, user_agent)
+    host = _host_of(url)
+
+    cached = _cache_lookup(url)
+    if cached is not None:
+        if cached.fresh:
+            return cached.body, cached.content_type
+        headers.update(cached.conditional_headers())
 
-    last_error: Optional[str] = None
     for attempt in range(max_retries + 1):
-        try:
-            resp = session.get(
-                url,
-                headers=headers,
-                timeout=DEFAULT_TIMEOUT,
-                stream=True,
-                allow_redirects=True,
-            )
-        except requests.RequestException as e:
-            last_error = f"network: {e}"
-            if attempt < max_retries:
-                time.sleep(0.4 * (attempt + 1))
-                continue
-            break
-
-        # Retry on transient server errors and rate limits
-        if resp.status_code in (429, 500, 502, 503, 504) and attempt < max_retries:
-            resp.close()
-            time.sleep(0.6 * (attempt + 1))
-            continue
+        hint: Optional[float] = None
+        # The slot is held through the body read, so the per-host limit
+        # really is the number of connections in use.
+        with _governor.slot(host, wait=not defer_retries):
+            try:
+                resp = session.get(
+                    url,
+                    headers=headers,
+                    timeout=DEFAULT_TIMEOUT,
+                    stream=True,
+                    allow_redirects=True,
+                )
+            except requests.RequestException:
+                reason = "network"
+            else:
+                if resp.status_code == 304 and cached is not None:
+                    resp.close()
+                    return _cache_revalidated(cached, resp.headers)
+                if resp.status_code not in RETRY_STATUSES:
+                    result = _read_response(resp, url, allow_html, stop_at)
+                    if result is not None:
+                        _negative_cache.record_success(host)
+                        _cache_store(url, resp.url, result, resp.headers)
+                    return result
+                # Transient server error or rate limit
+                resp.close()
+                reason = f"http {resp.status_code}"
+                hint = _retry_after_hint(host, resp.status_code, resp.headers.get("Retry-After"))
+                if hint is not None and hint > MAX_RETRY_AFTER_S:
+                    _negative_cache.block_host(host, f"retry-after {hint:.0f}s", hint)
+                    return None
+        if attempt >= max_retries:
+            remember_failure(url, reason, transient=True)
+            return None
+        if defer_retries:
+            raise RetryLater(reason, hint)
+        delay = backoff_delay(attempt, hint)
+        get_scheduler().note(delay, reason)
+        # Back off outside the slot so other fetches to this host can run.
+        time.sleep(delay)
+    return None
 
-        if resp.status_code != 200:
-            last_error = f"http {resp.status_code}"
-            resp.close()
-            break
 
-        content_type = (resp.headers.get("Content-Type") or "").split(";")[0].strip().lower()
+# Body read granularity. Small enough that the header sniffer sees the first
+# chunk (and can abort) before much of a rejected image is transferred.
+_READ_CHUNK = 16 * 1024
+
+
+def _declared_too_large(headers) -> bool:
+    try:
+        return int(headers.get("Content-Length") or 0) > MAX_RESPONSE_BYTES
+    except ValueError:
+        return False
+
+
+# How far back each `stop_at` search reaches into already-scanned bytes, so a
+# match split across chunks is still found without rescanning the whole body.
+_STOP_OVERLAP = 4096
+
+
+class _BodyReader:
+    """
+    Accumulates a response body chunk by chunk, enforcing
+    `MAX_RESPONSE_BYTES` and, for images, running `HeaderSniffer` over the
+    first bytes (see image_sniff.py). For other bodies an optional `stop_at`
+    pattern ends the read early (`complete`). Shared with the async engine.
+    """
+
+    def __init__(self, content_type: str, stop_at: Optional[re.Pattern] = None) -> None:
+        self._buf = bytearray()
         is_image = content_type.startswith("image/")
-        is_html = content_type in ("text/html", "application/xhtml+xml")
+        self._sniffer = HeaderSniffer() if is_image else None
+        self._stop_at = None if is_image else stop_at
+        self.complete = False
+
+    def add(self, chunk: bytes) -> Optional[str]:
+        """Add a chunk; returns a reason to abort the transfer, or None."""
+        start = len(self._buf)
+        self._buf += chunk
+        if self._stop_at is not None:
+            m = self._stop_at.search(self._buf, max(0, start - _STOP_OVERLAP))
+            if m is not None:
+                del self._buf[m.end():]
+                self.complete = True
+                return None
+        if len(self._buf) > MAX_RESPONSE_BYTES:
+            return "too large"
+        if self._sniffer is not None:
+            reason = self._sniffer.feed(chunk)
+            if self._sniffer.done:
+                self._sniffer = None
+            return reason
+        return None
+
+    def body(self) -> bytes:
+        return bytes(self._buf)
 
-        if not is_image and not (allow_html and is_html):
-            last_error = f"unexpected content-type: {content_type or '<none>'}"
-            resp.close()
-            break
 
+def _read_response(
+    resp: requests.Response, url: str, allow_html: bool, stop_at: Optional[re.Pattern] = None
+) -> Optional[Tuple[bytes, str]]:
+    """Status + content-type checks and a capped, sniffed body read; always
+    closes `resp` (dropping the connection if `stop_at` ended the read
+    early). Failures are remembered in the negative cache."""
+    try:
+        if resp.status_code != 200:
+            _remember_status(url, resp.status_code)
+            return None
+        content_type, acceptable = _accepted_content_type(resp.headers.get("Content-Type"), allow_html)
+        if not acceptable:
+            _remember_content_type(url, content_type)
+            return None
         # Guard against huge responses
+        if _declared_too_large(resp.headers):
+            remember_failure(url, "too large")
+            return None
+        reader = _BodyReader(content_type, stop_at)
         try:
-            body = resp.raw.read(MAX_RESPONSE_BYTES + 1, decode_content=True)
-        except Exception as e:
-            last_error = f"read: {e}"
-            resp.close()
-            break
-        finally:
-            resp.close()
-
-        if len(body) > MAX_RESPONSE_BYTES:
+            for chunk in resp.iter_content(_READ_CHUNK):
+                reason = reader.add(chunk)
+                if reason is not None:
+                    remember_failure(url, reason)
+                    return None
+                if reader.complete:
+                    break
+        except Exception:
+            remember_failure(url, "read error", transient=True)
             return None
-        return body, content_type
-
-    if last_error:
-        # Keep the log quiet; callers decide whether to print.
-        pass
-    return None
+        return reader.body(), content_type
+    finally:
+        resp.close()
@@ -0,0 +1,115 @@
+"""
+Early checks on the first bytes of an image download.
+
+Why: `fetch_bytes` used to read up to 20 MB before anything looked at the
+image. Candidates that can never match (icons and thumbnails too small to
+hold a detectable face, absurdly large scans, and HTML/JSON error pages
+served as `image/*`) cost full bandwidth and then a decode.
+
+`HeaderSniffer` is fed the body as it streams in. It checks the magic bytes
+as soon as the first few bytes arrive, then lets PIL parse the header (PIL
+only reads headers on `Image.open`) until the dimensions are known or
+`limit` bytes have been seen. The fetch is aborted on the first rejection.
+Formats PIL can't size from a prefix simply pass.
+"""
+from __future__ import annotations
+
+import os
+from io import BytesIO
+from typing import Optional, Tuple
+
+from PIL import Image
+
+
+# Shortest edge that can plausibly contain a detectable face.
+MIN_IMAGE_EDGE = int(os.environ.get("FETCH_MIN_IMAGE_EDGE", "48"))
+# Anything above this is a scan or a poster, not a photo of a person; it
+# would also trip PIL's decompression-bomb guard.
+MAX_IMAGE_PIXELS = int(os.environ.get("FETCH_MAX_IMAGE_PIXELS", str(60_000_000)))
+# Give up looking for dimensions after this many bytes (JPEG EXIF blocks can
+# push the frame header well past the first few KB).
+SNIFF_LIMIT = 64 * 1024
+
+_MAGIC = (
+    (b"\xff\xd8\xff", "jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"GIF87a", "gif"),
+    (b"GIF89a", "gif"),
+    (b"BM", "bmp"),
+    (b"II*\x00", "tiff"),
+    (b"MM\x00*", "tiff"),
+    (b"\x00\x00\x01\x00", "ico"),
+)
+
+_MAGIC_BYTES = 16
+
+
+def sniff_format(head: bytes) -> Optional[str]:
+    """Image format from magic bytes, or None if unrecognized."""
+    for magic, fmt in _MAGIC:
+        if head.startswith(magic):
+            return fmt
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    if head[4:8] == b"ftyp":
+        return "heif"  # AVIF/HEIC family
+    return None
+
+
+def _header_size(head: bytes) -> Optional[Tuple[int, int]]:
+    """Dimensions from a body prefix, or None if PIL can't tell yet. PIL's own
+    decompression-bomb guard raises `Image.DecompressionBombError` here."""
+    try:
+        with Image.open(BytesIO(head)) as img:
+            return img.size
+    except Image.DecompressionBombError:
+        raise
+    except Exception:
+        return None
+
+
+class HeaderSniffer:
+    def __init__(
+        self,
+        min_edge: int = MIN_IMAGE_EDGE,
+        max_pixels: int = MAX_IMAGE_PIXELS,
+        limit: int = SNIFF_LIMIT,
+    ) -> None:
+        self._min_edge = min_edge
+        self._max_pixels = max_pixels
+        self._limit = limit
+        self._head = bytearray()
+        self.format: Optional[str] = None
+        self.size: Optional[Tuple[int, int]] = None
+        self.done = False
+
+    def feed(self, chunk: bytes) -> Optional[str]:
+        """Feed the next body chunk; returns a rejection reason or None.
+        Once `done` is set, further chunks are ignored."""
+        if self.done:
+            return None
+        self._head += chunk[: self._limit - len(self._head)]
+        if self.format is None:
+            if len(self._head) < _MAGIC_BYTES:
+                return None
+            self.format = sniff_format(bytes(self._head[:_MAGIC_BYTES]))
+            if self.format is None:
+                self.done = True
+                return "not an image (unrecognized header)"
+        try:
+            size = _header_size(bytes(self._head))
+        except Image.DecompressionBombError:
+            self.done = True
+            return "too large (decompression bomb)"
+        if size is None:
+            if len(self._head) >= self._limit:
+                self.done = True
+            return None
+        self.done = True
+        self.size = size
+        width, height = size
+        if min(width, height) < self._min_edge:
+            return f"too small ({width}x{height})"
+        if width * height > self._max_pixels:
+            return f"too large ({width}x{height})"
+        return None
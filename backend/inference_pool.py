@@ -0,0 +1,87 @@
+"""
+Optional process-pool mode for face detection + embedding.
+
+Why: inside the Flask process every DeepFace/TensorFlow call shares one
+Python interpreter, so a single `/upload` can drive at most one inference
+stream no matter how many cores the box has. This module runs N worker
+processes that each preload Facenet512 (and the detector) once, and hands
+them decoded images through `multiprocessing.shared_memory`: the parent
+writes the pixels into a shared block once and only the block's name,
+shape and dtype are pickled across the process boundary.
+
+Enable with `FACE_INFERENCE_PROCESSES=<n>` (see face_recognition.py). Workers
+use the "spawn" start method; forking a process that already initialized
+TensorFlow is not safe.
+"""
+from __future__ import annotations
+
+import multiprocessing as mp
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Optional, Tuple
+
+import numpy as np
+
+
+def _worker_init() -> None:
+    # Importing preloads the model + detector. Under `python main.py` spawn
+    # has already imported it (as part of main.py, with the parent's
+    # environment), so the worker role is set explicitly.
+    import face_recognition
+
+    face_recognition.configure_inference_worker()
+    print(f"[InferencePool] Worker {os.getpid()} ready")
+
+
+def _worker_embed(shm_name: str, shape: Tuple[int, ...], dtype: str) -> Optional[list]:
+    import face_recognition
+
+    # Spawned workers share the parent's resource tracker, so attaching here
+    # does not take ownership; the parent unlinks the block.
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        img = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+        embedding = face_recognition._embed(img)
+        del img
+        return None if embedding is None else np.asarray(embedding).tolist()
+    finally:
+        try:
+            shm.close()
+        except BufferError:
+            # A traceback still references the view; the mapping is
+            # released when that frame is collected.
+            pass
+
+
+class InferencePool:
+    def __init__(self, processes: int) -> None:
+        self.processes = max(1, int(processes))
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.processes,
+            mp_context=mp.get_context("spawn"),
+            initializer=_worker_init,
+        )
+        print(f"[InferencePool] Started {self.processes} inference process(es)")
+
+    def embed_rgb(self, rgb: np.ndarray) -> Optional[np.ndarray]:
+        """
+        Embed one decoded RGB image in a worker process. The RGB->BGR flip
+        DeepFace expects is fused into the single copy into shared memory.
+        Raises whatever the worker raised (e.g. DeepFace's "no face" error).
+        """
+        shape = rgb.shape
+        shm = shared_memory.SharedMemory(create=True, size=max(1, rgb.nbytes))
+        try:
+            view = np.ndarray(shape, dtype=rgb.dtype, buffer=shm.buf)
+            np.copyto(view, rgb[..., ::-1] if rgb.ndim == 3 else rgb)
+            del view
+            fut = self._executor.submit(_worker_embed, shm.name, shape, rgb.dtype.str)
+            result = fut.result()
+        finally:
+            shm.close()
+            shm.unlink()
+        return None if result is None else np.asarray(result)
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
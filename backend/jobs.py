@@ -0,0 +1,152 @@
+"""
+Background job subsystem for the search-fetch-embed pipeline.
+
+Why: `/upload` runs the whole pipeline inside the request thread, so a few
+concurrent users tie up every Flask worker and long requests hit proxy
+timeouts. Jobs decouple the two: `POST /jobs` enqueues the work and returns
+immediately, a bounded pool of pipeline workers drains the queue, and
+`GET /jobs/<id>` reports progress and results. When the queue is full we
+refuse new work (the API returns 429) instead of letting it pile up.
+
+Jobs live in memory. Finished jobs are kept for `ttl_s` seconds so clients
+can collect the result, then dropped.
+"""
+from __future__ import annotations
+
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+
+class JobQueueFull(Exception):
+    """Raised by `JobManager.submit` when `max_pending` jobs are waiting."""
+
+
+class Job:
+    def __init__(self) -> None:
+        self.id = uuid.uuid4().hex
+        self.status = "queued"
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.searches: List[Dict[str, Any]] = []
+        self.candidates: Optional[int] = None
+        self.progress = {"done": 0, "total": 0}
+        self.matches: List[Dict[str, Any]] = []
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self._lock = threading.Lock()
+
+    def _set(self, **fields: Any) -> None:
+        with self._lock:
+            for name, value in fields.items():
+                setattr(self, name, value)
+
+    def record_event(self, event: Dict[str, Any]) -> None:
+        """Pipeline `emit` callback: fold a progress event into job state."""
+        kind = event.get("event")
+        with self._lock:
+            if kind == "search":
+                self.searches.append(
+                    {k: event.get(k) for k in ("source", "query", "count")}
+                )
+            elif kind == "candidates":
+                # Repeats with a growing total while searches are still
+                # feeding candidates in.
+                self.candidates = event.get("total")
+                self.progress = {"done": self.progress["done"], "total": event.get("total") or 0}
+            elif kind == "progress":
+                self.progress = {"done": event.get("done"), "total": event.get("total")}
+            elif kind == "match":
+                self.matches.append(event.get("match"))
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            out: Dict[str, Any] = {
+                "job_id": self.id,
+                "status": self.status,
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+                "searches": list(self.searches),
+                "candidates": self.candidates,
+                "progress": dict(self.progress),
+                "matches": list(self.matches),
+            }
+            if self.result is not None:
+                out["result"] = self.result
+            if self.error is not None:
+                out["error"] = self.error
+            return out
+
+
+class JobManager:
+    def __init__(self, workers: int = 2, max_pending: int = 20, ttl_s: float = 900.0) -> None:
+        self.workers = max(1, int(workers))
+        self.max_pending = max(0, int(max_pending))
+        self._ttl_s = ttl_s
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="job")
+        self._jobs: Dict[str, Job] = {}
+        self._pending = 0
+        self._running = 0
+        self._lock = threading.Lock()
+
+    def submit(self, fn: Callable[[Callable[[Dict[str, Any]], None]], Dict[str, Any]]) -> Job:
+        """
+        Enqueue `fn(emit)`; its return value becomes the job result. Raises
+        `JobQueueFull` if `max_pending` jobs are already waiting.
+        """
+        self._expire()
+        job = Job()
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise JobQueueFull(f"{self._pending} jobs already queued")
+            self._pending += 1
+            self._jobs[job.id] = job
+        self._executor.submit(self._run, job, fn)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        self._expire()
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "queued": self._pending,
+                "running": self._running,
+                "max_pending": self.max_pending,
+                "tracked": len(self._jobs),
+            }
+
+    def _run(self, job: Job, fn) -> None:
+        with self._lock:
+            self._pending -= 1
+            self._running += 1
+        job._set(status="running", started_at=time.time())
+        try:
+            result = fn(job.record_event)
+            job._set(result=result, status="done")
+        except Exception as e:
+            print(f"[Jobs] Job {job.id} failed: {e}")
+            traceback.print_exc()
+            job._set(error=str(e), status="error")
+        finally:
+            job._set(finished_at=time.time())
+            with self._lock:
+                self._running -= 1
+
+    def _expire(self) -> None:
+        cutoff = time.time() - self._ttl_s
+        with self._lock:
+            stale = [
+                jid for jid, job in self._jobs.items()
+                if job.finished_at is not None and job.finished_at < cutoff
+            ]
+            for jid in stale:
+                del self._jobs[jid]
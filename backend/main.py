@@ -15,20 +15,28 @@ except ImportError:
     print("Or use a venv: python3 -m venv venv && source venv/bin/activate && pip install -r requirements.txt", file=sys.stderr)
     sys.exit(1)
 
+import json
+import math
+import queue
 import re
+import threading
+import uuid
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from urllib.parse import urlsplit, urlunsplit
 
-from flask import Flask, request, jsonify, send_file
+from flask import Flask, Response, request, jsonify, send_file
 from flask_cors import CORS
 from dotenv import load_dotenv
 from werkzeug.utils import secure_filename
 
 from search_images import search_images_bing
-from search_google_images import search_images_google
+from search_google_images import search_images_google, serpapi_quota_stats
 from search_duckduckgo_images import search_images_duckduckgo
-from face_recognition import extract_face_embedding, match_faces
+from face_recognition import extract_reference_embeddings, match_faces
 from report_generator import generate_report_link, build_removal_plan
+from jobs import JobManager, JobQueueFull
+from search_cache import cached_search, search_cache_stats
+from source_stats import get_source_stats
 
 load_dotenv()
 
@@ -83,12 +91,28 @@ def is_blocked_url(url: str) -> bool:
     return False
 
 
+def interleave_by_rank(result_lists):
+    """
+    Round-robin merge of per-search-job result lists: every job's #1 result,
+    then every job's #2, and so on. Search engines rank their best hits
+    first, so this is the order we want candidates embedded in when matching
+    may stop early.
+    """
+    merged = []
+    longest = max((len(r) for r in result_lists), default=0)
+    for rank in range(longest):
+        for results in result_lists:
+            if rank < len(results):
+                merged.append(results[rank])
+    return merged
+
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 @app.route('/health', methods=['GET'])
 def health():
-    return jsonify({'status': 'ok'}), 200
+    return jsonify({'status': 'ok', 'jobs': _get_jobs().stats()}), 200
 
 @app.route('/image/<path:filepath>', methods=['GET'])
 def serve_image(filepath):
@@ -112,191 +136,518 @@ _SEARCH_SOURCES = {
 
 
 def _run_source(source_name: str, fn, query: str, max_images: int):
-    """Shim used by the ThreadPool so we know which source each future belongs to."""
+    """
+    Shim used by the ThreadPool so we know which source each future belongs
+    to. Goes through the search-result cache (search_cache.py), and on a miss
+    through the source's latency tracking and hedging (source_stats.py); the
+    last element says how the results were served.
+    """
     try:
-        return source_name, query, fn(query=query, max_images=max_images)
+        timed_fn = get_source_stats().timed(source_name, fn)
+        results, cache_status = cached_search(source_name, timed_fn, query, max_images)
+        return source_name, query, results, cache_status
     except Exception as e:
         print(f"[Search] {source_name} failed for '{query}': {e}")
-        return source_name, query, []
+        return source_name, query, [], "miss"
 
 
-@app.route('/upload', methods=['POST'])
-def upload_image():
+class _CandidateFeed:
     """
-    User uploads their photo with hijab AND provides search terms.
-    Extract face embedding and search for images matching those terms across
-    Bing, Google (via SerpApi), and DuckDuckGo - all fanned out in parallel.
+    Iterable of match candidates built from search jobs as they finish, so
+    `match_faces` starts on the fast sources' results while slow ones (e.g.
+    SerpApi) are still running. Each finished job's results are blocklisted
+    and deduplicated against everything seen so far.
+
+    While other jobs are pending, a job only contributes its share of the
+    budget (`futures` maps each job to it; best-ranked first), so one fast
+    source can't fill the whole candidate budget on its own. The held-back
+    rest is released, interleaved by rank, once every job has reported.
     """
-    try:
-        if 'file' not in request.files:
-            return jsonify({'error': 'No file provided'}), 400
-
-        file = request.files['file']
-        if file.filename == '':
-            return jsonify({'error': 'No file selected'}), 400
 
+    def __init__(self, futures, max_candidates, on_search=None, on_candidates=None):
+        self._futures = futures
+        self._max = max_candidates
+        self._on_search = on_search
+        self._on_candidates = on_candidates
+        self._seen = set()
+        self._closed = False
+        self._pending = len(futures)
+        self.raw = 0
+        self.blocked = 0
+        self.fed = 0
+        self.fed_by_source = {}
+
+    def close(self):
+        """Stop taking search results; returns how many jobs hadn't reported."""
+        self._closed = True
+        return self._pending
+
+    def _accept(self, results):
+        fresh = []
+        for r in results:
+            self.raw += 1
+            if is_blocked_url(r.get('url', '')):
+                self.blocked += 1
+                continue
+            dedup_key = normalize_url_for_dedup(r.get('url'))
+            if dedup_key in self._seen:
+                continue
+            self._seen.add(dedup_key)
+            fresh.append(r)
+        return fresh
+
+    def _release(self, results):
+        released = []
+        for r in results:
+            if self.fed >= self._max:
+                break
+            self.fed += 1
+            source = r.get('source')
+            self.fed_by_source[source] = self.fed_by_source.get(source, 0) + 1
+            released.append(r)
+        if released and self._on_candidates is not None:
+            self._on_candidates(self.fed)
+        return released
+
+    def __iter__(self):
+        held_back = []
+        for fut in as_completed(self._futures):
+            if self._closed:
+                return
+            share = self._futures[fut]
+            source_name, query, results, cache_status = fut.result()
+            self._pending -= 1
+            if self._on_search is not None:
+                self._on_search(source_name, query, results, cache_status)
+            fresh = self._accept(results)
+            held_back.append(fresh[share:])
+            yield from self._release(fresh[:share])
+        yield from self._release(interleave_by_rank(held_back))
+
+
+class _UploadError(Exception):
+    """Validation failure in an upload request; carries the HTTP status."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def _save_upload():
+    """
+    Validate the multipart request and save the reference photo(s). Returns
+    `(search_terms, filenames, filepaths)`; raises `_UploadError` for
+    anything the client got wrong.
+    """
+    # Several enrolled photos may be sent as repeated `file` fields; more
+    # reference angles improve recall without re-running the pipeline.
+    files = [f for f in request.files.getlist('file') if f and f.filename]
+    if not request.files.getlist('file'):
+        raise _UploadError('No file provided')
+    if not files:
+        raise _UploadError('No file selected')
+
+    for file in files:
         if not allowed_file(file.filename):
-            return jsonify({'error': 'File type not allowed'}), 400
-
-        search_terms = request.form.get('search_terms', '').strip()
-        if not search_terms:
-            return jsonify({'error': 'Please provide search terms (name, username, etc.)'}), 400
-
+            raise _UploadError('File type not allowed')
+
+    search_terms = request.form.get('search_terms', '').strip()
+    if not search_terms:
+        raise _UploadError('Please provide search terms (name, username, etc.)')
+
+    filenames = []
+    filepaths = []
+    # Saved under a per-file unique name: embedding may run later on a job
+    # worker, and two uploads of "image.jpg" (or repeated `file` fields with
+    # the same name) must not overwrite each other first.
+    for file in files:
         filename = secure_filename(file.filename)
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+        filepath = os.path.join(app.config['UPLOAD_FOLDER'], f"{uuid.uuid4().hex}_{filename}")
         file.save(filepath)
-
+        filenames.append(filename)
+        filepaths.append(filepath)
         print(f"\n[Upload] File saved: {filepath}")
-        print(f"[Upload] Search terms: {search_terms}")
-
-        print("[Upload] Extracting face embedding from user's photo...")
-        user_embedding = extract_face_embedding(filepath)
-        if user_embedding is None:
-            return jsonify({'error': 'No face detected in image'}), 400
-        print("[Upload] Face embedding extracted successfully")
-
-        images_per_source = get_env_int("IMAGES_PER_SOURCE", 3)
-        max_search_queries = get_env_int("MAX_SEARCH_QUERIES", 2)
-        max_candidate_images = get_env_int("MAX_CANDIDATE_IMAGES", 15)
-        max_matched_images = get_env_int("MAX_MATCHED_IMAGES", 8)
-
-        # Broader query set: users want results from every major social platform,
-        # not just "name" alone. Instagram/Facebook/TikTok queries surface
-        # social profiles Bing wouldn't rank highly for a bare-name query.
-        search_queries = [
-            search_terms,
-            f"{search_terms} instagram",
-            f"{search_terms} facebook",
-            f"{search_terms} tiktok",
-            f"{search_terms} linkedin",
-            f"{search_terms} twitter",
-        ]
-        search_queries = search_queries[:max_search_queries]
-
-        source_counts = {name: 0 for name in _SEARCH_SOURCES}
-        source_notes = []
-        if not os.environ.get("SERPAPI_API_KEY"):
-            source_notes.append(
-                "Google Images is disabled until SERPAPI_API_KEY is set in backend/.env"
-            )
+    print(f"[Upload] Search terms: {search_terms}")
+    return search_terms, filenames, filepaths
+
+
+def _embed_references(filepaths):
+    """Embed the saved reference photo(s); raises `_UploadError` if none has a face."""
+    print(f"[Upload] Extracting face embeddings from {len(filepaths)} reference photo(s)...")
+    user_embeddings = extract_reference_embeddings(filepaths)
+    if user_embeddings is None:
+        raise _UploadError('No face detected in image')
+    print(f"[Upload] {len(user_embeddings)} reference embedding(s) extracted successfully")
+    return user_embeddings
+
+
+def _prepare_upload():
+    """Save + embed in one step. Returns `(user_embeddings, search_terms, filenames)`."""
+    search_terms, filenames, filepaths = _save_upload()
+    return _embed_references(filepaths), search_terms, filenames
+
+
+def _match_key(match):
+    # Near-duplicate group first (resized/recompressed copies), then
+    # byte-identical files, then URL.
+    return (
+        match.get("perceptual_hash")
+        or match.get("image_hash")
+        or normalize_url_for_dedup(match.get("url"))
+    )
+
 
-        # Fan out: every (source, query) pair runs in parallel.
-        fan_out_jobs = [
-            (source_name, fn, query)
-            for source_name, fn in _SEARCH_SOURCES.items()
-            for query in search_queries
-        ]
-
-        all_search_results = []
-        print(
-            f"\n[Upload] Running {len(fan_out_jobs)} search jobs in parallel "
-            f"({len(_SEARCH_SOURCES)} sources x {len(search_queries)} queries)"
+def _public_match(match):
+    # Legacy behavior: dataset/*.jpg were served via /image/. The new
+    # pipeline uses remote URLs directly, but we keep this rewrite for
+    # any leftover local results.
+    if match['url'].startswith('dataset/'):
+        match = dict(match, url=f"http://localhost:5000/image/{match['url']}")
+    return match
+
+
+def _run_upload_pipeline(user_embeddings, search_terms, filenames, emit=None):
+    """
+    Search -> blocklist/dedup -> face matching for one upload. Returns the
+    `/upload` JSON payload. Matching overlaps the search: candidates from
+    each search job are fed to `match_faces` as soon as the job finishes
+    (see `_CandidateFeed`).
+
+    If `emit` is given it is called with event dicts as work completes:
+    `search` (one per finished source/query), `candidates` (running total,
+    again each time more arrive), `progress`, and `match` (each
+    deduplicated match as soon as it is scored).
+    """
+    def _emit(event, **fields):
+        if emit is not None:
+            emit(dict(event=event, **fields))
+
+    match_aggregate = os.environ.get("MATCH_AGGREGATE", "min")
+    if match_aggregate not in ("min", "mean"):
+        match_aggregate = "min"
+
+    images_per_source = get_env_int("IMAGES_PER_SOURCE", 3)
+    max_search_queries = get_env_int("MAX_SEARCH_QUERIES", 2)
+    max_candidate_images = get_env_int("MAX_CANDIDATE_IMAGES", 15)
+    max_matched_images = get_env_int("MAX_MATCHED_IMAGES", 8)
+    # 0 disables the per-request matching time budget.
+    match_time_budget_s = get_env_int("MATCH_TIME_BUDGET_S", 0)
+
+    # Broader query set: users want results from every major social platform,
+    # not just "name" alone. Instagram/Facebook/TikTok queries surface
+    # social profiles Bing wouldn't rank highly for a bare-name query.
+    search_queries = [
+        search_terms,
+        f"{search_terms} instagram",
+        f"{search_terms} facebook",
+        f"{search_terms} tiktok",
+        f"{search_terms} linkedin",
+        f"{search_terms} twitter",
+    ]
+    search_queries = search_queries[:max_search_queries]
+
+    source_counts = {name: 0 for name in _SEARCH_SOURCES}
+    source_notes = []
+    active_sources = dict(_SEARCH_SOURCES)
+    if not os.environ.get("SERPAPI_API_KEY"):
+        # Its searches would only come back empty; don't run or budget them.
+        active_sources.pop("Google Images", None)
+        source_notes.append(
+            "Google Images is disabled until SERPAPI_API_KEY is set in backend/.env"
         )
-        with ThreadPoolExecutor(max_workers=min(12, max(2, len(fan_out_jobs)))) as pool:
-            futures = [
-                pool.submit(_run_source, name, fn, q, images_per_source)
-                for name, fn, q in fan_out_jobs
-            ]
-            for fut in as_completed(futures):
-                source_name, query, results = fut.result()
-                source_counts[source_name] = source_counts.get(source_name, 0) + len(results)
-                all_search_results.extend(results)
-                print(f"[Upload] {source_name} ({query}): {len(results)} images")
-
-        if not all_search_results:
-            return jsonify({
-                'error': 'No images found for those search terms. Try different terms.',
-                'matches': [],
-                'search_debug': {
-                    'queries_used': search_queries,
-                    'source_counts': source_counts,
-                    'source_notes': source_notes,
-                },
-            }), 200
-
-        print(f"\n[Upload] Total images found: {len(all_search_results)}")
-
-        blocked_count = 0
-        filtered_results = []
-        for r in all_search_results:
-            url = r.get('url', '')
-            if is_blocked_url(url):
-                blocked_count += 1
-                continue
-            filtered_results.append(r)
-        if blocked_count:
-            source_notes.append(f"{blocked_count} URL(s) skipped by blocklist")
-            print(f"[Upload] Blocklist skipped {blocked_count} URL(s)")
-
-        seen_urls = set()
-        unique_results = []
-        for result in filtered_results:
-            dedup_key = normalize_url_for_dedup(result.get('url'))
-            if dedup_key not in seen_urls:
-                seen_urls.add(dedup_key)
-                unique_results.append(result)
-
-        print(f"[Upload] Unique images after dedup: {len(unique_results)}")
-        unique_results = unique_results[:max_candidate_images]
-        print(f"[Upload] Candidate images after limit: {len(unique_results)}")
-
-        print("\n[Upload] Starting face matching...")
+
+    # Fan out: every (source, query) pair runs in parallel, and matching
+    # starts on the first job's candidates while the rest are still running.
+    fan_out_jobs = [
+        (source_name, fn, query)
+        for source_name, fn in active_sources.items()
+        for query in search_queries
+    ]
+
+    search_cache_counts = {"hit": 0, "stale": 0, "miss": 0, "off": 0}
+
+    def _on_search(source_name, query, results, cache_status):
+        source_counts[source_name] = source_counts.get(source_name, 0) + len(results)
+        search_cache_counts[cache_status] += 1
+        print(f"[Upload] {source_name} ({query}): {len(results)} images ({cache_status})")
+        _emit('search', source=source_name, query=query, count=len(results), cache=cache_status)
+
+    print(
+        f"\n[Upload] Running {len(fan_out_jobs)} search jobs in parallel "
+        f"({len(active_sources)} sources x {len(search_queries)} queries)"
+    )
+    # Split the candidate budget by each source's observed yield and latency
+    # (even until there's enough history): how many candidates each job may
+    # feed before the rest have reported. Every source is still asked for
+    # IMAGES_PER_SOURCE results, so the search cache key doesn't move with
+    # the shares.
+    source_stats = get_source_stats()
+    shares = source_stats.shares(list(active_sources))
+    source_budget = {}
+    for name, share in shares.items():
+        source_budget[name] = {
+            'share': round(share, 3),
+            'candidates_per_query': max(
+                1, math.ceil(max_candidate_images * share / max(1, len(search_queries)))
+            ),
+        }
+    pool = ThreadPoolExecutor(max_workers=min(12, max(2, len(fan_out_jobs))))
+    futures = {
+        pool.submit(_run_source, name, fn, q, images_per_source):
+            source_budget[name]['candidates_per_query']
+        for name, fn, q in fan_out_jobs
+    }
+    feed = _CandidateFeed(
+        futures,
+        max_candidates=max_candidate_images,
+        on_search=_on_search,
+        on_candidates=lambda total: _emit('candidates', total=total),
+    )
+
+    streamed_keys = set()
+
+    def _on_match(match):
+        key = _match_key(match)
+        if key in streamed_keys or len(streamed_keys) >= max_matched_images:
+            return
+        streamed_keys.add(key)
+        _emit('match', match=_public_match(match))
+
+    print("\n[Upload] Starting face matching as search results arrive...")
+    match_stats = {}
+    try:
         matched_images = match_faces(
-            user_embedding=user_embedding,
-            search_results=unique_results,
+            user_embedding=user_embeddings,
+            search_results=feed,
             threshold=0.5,
+            aggregate=match_aggregate,
+            stats=match_stats,
+            # Over-collect a little: some matches collapse in dedup below.
+            max_matches=max_matched_images + 2,
+            time_budget_s=match_time_budget_s or None,
+            on_progress=(lambda done, total: _emit('progress', done=done, total=total)) if emit else None,
+            on_match=_on_match if emit else None,
         )
-
-        print(f"[Upload] Found {len(matched_images)} matching images")
-        deduped_matches = []
-        seen_match_keys = set()
-        for match in matched_images:
-            match_key = match.get("image_hash") or normalize_url_for_dedup(match.get("url"))
-            if match_key in seen_match_keys:
-                continue
-            seen_match_keys.add(match_key)
-            deduped_matches.append(match)
-        matched_images = deduped_matches[:max_matched_images]
-        print(f"[Upload] Final deduped matches: {len(matched_images)}")
-
-        # Legacy behavior: dataset/*.jpg were served via /image/. The new
-        # pipeline uses remote URLs directly, but we keep this rewrite for
-        # any leftover local results.
-        for match in matched_images:
-            if match['url'].startswith('dataset/'):
-                match['url'] = f"http://localhost:5000/image/{match['url']}"
-
-        return jsonify({
-            'status': 'success',
-            'matches': matched_images,
-            'count': len(matched_images),
-            'uploaded_file': filename,
-            'search_terms': search_terms,
+    finally:
+        # Searches that hadn't finished when matching stopped early are
+        # dropped; their results still land in the search cache.
+        unfinished = feed.close()
+        pool.shutdown(wait=False, cancel_futures=True)
+    if unfinished:
+        source_notes.append(
+            f"{unfinished} search job(s) still running when matching stopped; not included"
+        )
+    if feed.blocked:
+        source_notes.append(f"{feed.blocked} URL(s) skipped by blocklist")
+    # Candidates abandoned by an early stop never had a chance to match;
+    # count each source's fed candidates in proportion to what was scored.
+    if feed.fed:
+        scored = (feed.fed - match_stats.get('cancelled', 0)) / feed.fed
+        for name in active_sources:
+            source_stats.record_yield(
+                name,
+                feed.fed_by_source.get(name, 0) * scored,
+                sum(1 for m in matched_images if m.get('source') == name),
+            )
+    print(
+        f"[Upload] Images found: {feed.raw}, after blocklist: {feed.raw - feed.blocked}, "
+        f"candidates: {feed.fed}"
+    )
+
+    if not feed.raw:
+        return {
+            'error': 'No images found for those search terms. Try different terms.',
+            'matches': [],
             'search_debug': {
                 'queries_used': search_queries,
-                'limits': {
-                    'images_per_source': images_per_source,
-                    'max_search_queries': max_search_queries,
-                    'max_candidate_images': max_candidate_images,
-                    'max_matched_images': max_matched_images,
-                },
                 'source_counts': source_counts,
                 'source_notes': source_notes,
-                'totals': {
-                    'raw': len(all_search_results),
-                    'after_blocklist': len(filtered_results),
-                    'after_dedup': len(unique_results),
-                    'matches': len(matched_images),
-                },
+                'search_cache': {**search_cache_counts, 'store': search_cache_stats()},
+            },
+        }
+
+    print(f"[Upload] Found {len(matched_images)} matching images")
+    deduped_matches = []
+    seen_match_keys = set()
+    for match in matched_images:
+        match_key = _match_key(match)
+        if match_key in seen_match_keys:
+            continue
+        seen_match_keys.add(match_key)
+        deduped_matches.append(match)
+    matched_images = [_public_match(m) for m in deduped_matches[:max_matched_images]]
+    print(f"[Upload] Final deduped matches: {len(matched_images)}")
+
+    return {
+        'status': 'success',
+        'matches': matched_images,
+        'count': len(matched_images),
+        'uploaded_file': filenames[0],
+        'uploaded_files': filenames,
+        'search_terms': search_terms,
+        'search_debug': {
+            'queries_used': search_queries,
+            'reference_photos': len(user_embeddings),
+            'match_aggregate': match_aggregate,
+            'limits': {
+                'images_per_source': images_per_source,
+                'max_search_queries': max_search_queries,
+                'max_candidate_images': max_candidate_images,
+                'max_matched_images': max_matched_images,
+                'match_time_budget_s': match_time_budget_s,
+            },
+            'source_counts': source_counts,
+            'source_notes': source_notes,
+            'search_cache': {**search_cache_counts, 'store': search_cache_stats()},
+            'source_budget': source_budget,
+            'source_stats': source_stats.stats(),
+            'serpapi_quota': serpapi_quota_stats(),
+            'match_stats': match_stats,
+            'totals': {
+                'raw': feed.raw,
+                'after_blocklist': feed.raw - feed.blocked,
+                'after_dedup': feed.fed,
+                'matches': len(matched_images),
             },
-        }), 200
+        },
+    }
+
+
+@app.route('/upload', methods=['POST'])
+def upload_image():
+    """
+    User uploads their photo(s) with hijab AND provides search terms.
+    Extract face embedding and search for images matching those terms across
+    Bing, Google (via SerpApi), and DuckDuckGo - all fanned out in parallel.
+    """
+    try:
+        user_embeddings, search_terms, filenames = _prepare_upload()
+        return jsonify(_run_upload_pipeline(user_embeddings, search_terms, filenames)), 200
+    except _UploadError as e:
+        return jsonify({'error': str(e)}), e.status
+    except Exception as e:
+        print(f"[Upload] Error: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({'error': str(e)}), 500
+
 
+@app.route('/upload/stream', methods=['POST'])
+def upload_image_stream():
+    """
+    Same request as /upload, but the response is NDJSON: one JSON event per
+    line as work completes, so the UI can show matches within seconds instead
+    of after the whole pipeline. Events: `search`, `candidates`, `progress`,
+    `match`, then a final `done` whose `result` is the full /upload payload
+    (or `error`).
+    """
+    try:
+        user_embeddings, search_terms, filenames = _prepare_upload()
+    except _UploadError as e:
+        return jsonify({'error': str(e)}), e.status
     except Exception as e:
         print(f"[Upload] Error: {str(e)}")
         import traceback
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
 
+    events = queue.Queue()
+
+    def _worker():
+        try:
+            result = _run_upload_pipeline(user_embeddings, search_terms, filenames, emit=events.put)
+            events.put({'event': 'done', 'result': result})
+        except Exception as e:
+            print(f"[Upload] Stream error: {str(e)}")
+            import traceback
+            traceback.print_exc()
+            events.put({'event': 'error', 'error': str(e)})
+        finally:
+            events.put(None)
+
+    threading.Thread(target=_worker, name="upload-stream", daemon=True).start()
+
+    def _generate():
+        while True:
+            event = events.get()
+            if event is None:
+                return
+            yield json.dumps(event) + "\n"
+
+    return Response(
+        _generate(),
+        mimetype='application/x-ndjson',
+        # Ask reverse proxies (nginx) not to buffer the stream.
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
+
+# Background pipeline jobs: JOB_WORKERS pipelines run at once and at most
+# JOB_QUEUE_MAX more wait; beyond that POST /jobs answers 429. Created on
+# first use: inference pool workers (spawn) import this module too, and
+# must not start a job manager of their own.
+_jobs = None
+_jobs_lock = threading.Lock()
+
+
+def _get_jobs():
+    global _jobs
+    if _jobs is None:
+        with _jobs_lock:
+            if _jobs is None:
+                _jobs = JobManager(
+                    workers=get_env_int("JOB_WORKERS", 2),
+                    max_pending=get_env_int("JOB_QUEUE_MAX", 20),
+                    ttl_s=get_env_int("JOB_RESULT_TTL_S", 900),
+                )
+    return _jobs
+
+
+@app.route('/jobs', methods=['POST'])
+def create_job():
+    """
+    Same form as /upload, but only validates and saves the photo(s) in the
+    request thread. Embedding, search and matching run on a background
+    worker; poll `GET /jobs/<job_id>` for progress and the result.
+    """
+    try:
+        search_terms, filenames, filepaths = _save_upload()
+    except _UploadError as e:
+        return jsonify({'error': str(e)}), e.status
+    except Exception as e:
+        print(f"[Jobs] Error: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({'error': str(e)}), 500
+
+    def _pipeline(emit):
+        user_embeddings = _embed_references(filepaths)
+        return _run_upload_pipeline(user_embeddings, search_terms, filenames, emit=emit)
+
+    try:
+        job = _get_jobs().submit(_pipeline)
+    except JobQueueFull as e:
+        print(f"[Jobs] Rejecting job: {e}")
+        response = jsonify({'error': 'Server is busy, please retry shortly', 'queue': _get_jobs().stats()})
+        response.headers['Retry-After'] = '10'
+        return response, 429
+
+    return jsonify({
+        'status': job.status,
+        'job_id': job.id,
+        'status_url': f"/jobs/{job.id}",
+    }), 202
+
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Progress (searches, candidates, matches so far) and, once done, the
+    full /upload payload under `result`."""
+    job = _get_jobs().get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown or expired job'}), 404
+    return jsonify(job.to_dict()), 200
+
 
 @app.route('/report', methods=['POST'])
 def generate_report():
@@ -0,0 +1,118 @@
+"""
+TTL cache of recent fetch failures, by URL and by host.
+
+Why: `fetch_bytes` returned None for 404s, 403s and wrong content types and
+forgot why, so the next request retried the same dead Instagram crawler URL
+with its full retry budget. A large share of per-request fetch time went to
+URLs that had failed identically minutes earlier.
+
+- Permanent failures (4xx, non-image content, oversized bodies, pages with no
+  og:image) block the URL for `url_ttl_s`.
+- Transient failures that survived every retry (5xx, network errors) block
+  the URL for the shorter `host_ttl_s` and count against the host; after
+  `host_failures` of those in a row the whole host is blocked for
+  `host_ttl_s`. Any success clears the host's count.
+- A host that asks for a `Retry-After` beyond what we're willing to wait is
+  blocked for that long.
+
+In memory and per process; entries carry the failure reason for logging.
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+
+URL_TTL_S = float(os.environ.get("NEGATIVE_CACHE_URL_TTL_S", "3600"))
+HOST_TTL_S = float(os.environ.get("NEGATIVE_CACHE_HOST_TTL_S", "300"))
+# Consecutive exhausted-retry failures before a whole host is skipped.
+HOST_FAILURES = int(os.environ.get("NEGATIVE_CACHE_HOST_FAILURES", "3"))
+MAX_ENTRIES = int(os.environ.get("NEGATIVE_CACHE_MAX_ENTRIES", "50000"))
+
+
+class NegativeCache:
+    def __init__(
+        self,
+        url_ttl_s: float = URL_TTL_S,
+        host_ttl_s: float = HOST_TTL_S,
+        host_failures: int = HOST_FAILURES,
+        max_entries: int = MAX_ENTRIES,
+    ) -> None:
+        self._url_ttl_s = url_ttl_s
+        self._host_ttl_s = host_ttl_s
+        self._host_failures = max(1, int(host_failures))
+        self._max_entries = max(1, int(max_entries))
+        # url -> (expires_at, reason, transient)
+        self._urls: "OrderedDict[str, Tuple[float, str, bool]]" = OrderedDict()
+        self._hosts: Dict[str, Tuple[float, str]] = {}
+        self._host_streaks: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._counts = {"url_hits": 0, "host_hits": 0, "recorded": 0, "hosts_blocked": 0}
+
+    def check(self, url: str, host: str) -> Optional[str]:
+        """Reason `url` (or its host) is currently known bad, else None."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._urls.get(url)
+            if entry is not None:
+                if entry[0] > now:
+                    self._counts["url_hits"] += 1
+                    return entry[1]
+                del self._urls[url]
+            entry = self._hosts.get(host) if host else None
+            if entry is not None:
+                if entry[0] > now:
+                    self._counts["host_hits"] += 1
+                    return f"host {host}: {entry[1]}"
+                del self._hosts[host]
+        return None
+
+    def permanent(self, url: str) -> Optional[str]:
+        """Reason `url` itself failed permanently (4xx, wrong content, ...) and
+        is still blocked, else None. Host blocks and transient failures don't
+        count."""
+        with self._lock:
+            entry = self._urls.get(url)
+        if entry is None or entry[2] or entry[0] <= time.monotonic():
+            return None
+        return entry[1]
+
+    def record(self, url: str, host: str, reason: str, transient: bool = False) -> None:
+        """Remember a failed fetch. `transient` failures are remembered
+        briefly and count toward blocking the host."""
+        now = time.monotonic()
+        ttl = self._host_ttl_s if transient else self._url_ttl_s
+        with self._lock:
+            self._urls[url] = (now + ttl, reason, transient)
+            self._urls.move_to_end(url)
+            while len(self._urls) > self._max_entries:
+                self._urls.popitem(last=False)
+            self._counts["recorded"] += 1
+            if transient and host:
+                streak = self._host_streaks.get(host, 0) + 1
+                self._host_streaks[host] = streak
+                if streak >= self._host_failures:
+                    self._block_host_locked(host, reason, self._host_ttl_s)
+
+    def block_host(self, host: str, reason: str, ttl_s: float) -> None:
+        if not host:
+            return
+        with self._lock:
+            self._block_host_locked(host, reason, ttl_s)
+
+    def _block_host_locked(self, host: str, reason: str, ttl_s: float) -> None:
+        self._hosts[host] = (time.monotonic() + ttl_s, reason)
+        self._host_streaks.pop(host, None)
+        self._counts["hosts_blocked"] += 1
+
+    def record_success(self, host: str) -> None:
+        if host and host in self._host_streaks:
+            with self._lock:
+                self._host_streaks.pop(host, None)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self._counts, "urls": len(self._urls), "hosts": len(self._hosts)}
@@ -0,0 +1,108 @@
+"""
+Perceptual hashing for near-duplicate candidate images.
+
+Why: the same photo comes back from Bing, Google and DuckDuckGo at different
+resolutions and JPEG qualities. `normalize_url_for_dedup` only catches
+identical URL paths and the SHA-256 `image_hash` only catches byte-identical
+files, so each copy used to be embedded separately and could show up as
+several matches.
+
+A 64-bit dHash (sign of horizontal gradients on a 9x8 grayscale thumbnail)
+survives resizing and recompression; two copies of one photo typically land
+within a few bits of each other. `NearDuplicateIndex` keeps the hashes seen
+during one `match_faces` call and lets later copies reuse the first copy's
+embedding instead of running detection + inference again.
+"""
+from __future__ import annotations
+
+import threading
+from typing import List, Optional, Tuple
+
+import cv2
+import numpy as np
+
+
+# Hamming distance (out of 64 bits) at or below which two images are treated
+# as the same photo. 6 tolerates rescaling/recompression without merging
+# different shots from the same photo session.
+DEFAULT_MAX_DISTANCE = 6
+
+
+def dhash(rgb: np.ndarray, hash_size: int = 8) -> int:
+    """64-bit difference hash of an RGB (or grayscale) uint8 array."""
+    gray = cv2.cvtColor(rgb, cv2.COLOR_RGB2GRAY) if rgb.ndim == 3 else rgb
+    small = cv2.resize(gray, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    bits = small[:, 1:] > small[:, :-1]
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+class _Entry:
+    __slots__ = ("phash", "key", "embedding", "_ready")
+
+    def __init__(self, phash: int) -> None:
+        self.phash = phash
+        self.key = f"{phash:016x}"
+        self.embedding: Optional[np.ndarray] = None
+        self._ready = threading.Event()
+
+    def resolve(self, embedding: Optional[np.ndarray]) -> None:
+        self.embedding = embedding
+        self._ready.set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self._ready.wait(timeout)
+
+    def resolved(self) -> bool:
+        return self._ready.is_set()
+
+
+class NearDuplicateIndex:
+    """
+    Thread-safe per-request index of perceptual hashes.
+
+    `claim(phash)` either returns an existing near-duplicate entry (the
+    caller should `wait()` on it and reuse its embedding) or registers a new
+    entry that the caller owns and must `resolve()`. Holding the claim while
+    embedding means two workers racing on copies of the same photo only
+    embed it once.
+
+    Lookups are a linear Hamming scan; a request has at most a few hundred
+    candidates, which is far cheaper than any tree bookkeeping.
+    """
+
+    def __init__(self, max_distance: int = DEFAULT_MAX_DISTANCE) -> None:
+        self._max_distance = max_distance
+        self._entries: List[_Entry] = []
+        self._lock = threading.Lock()
+
+    def claim(self, phash: int) -> Tuple[_Entry, bool]:
+        """Return `(entry, owner)`; `owner` is True for a newly added hash."""
+        with self._lock:
+            best: Optional[_Entry] = None
+            best_dist = self._max_distance + 1
+            for entry in self._entries:
+                d = hamming(entry.phash, phash)
+                if d < best_dist:
+                    best, best_dist = entry, d
+            if best is not None:
+                return best, False
+            entry = _Entry(phash)
+            self._entries.append(entry)
+            return entry, True
+
+    def release_pending(self) -> int:
+        """Resolve every unresolved entry with no embedding, so waiters stop
+        blocking once their owners have been abandoned. Returns the count."""
+        with self._lock:
+            pending = [e for e in self._entries if not e.resolved()]
+        for entry in pending:
+            entry.resolve(None)
+        return len(pending)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
@@ -0,0 +1,141 @@
+"""
+Deferred retries for failed fetches.
+
+Why: `fetch_bytes` used to retry 429/5xx by sleeping inside the calling
+thread, so a flaky host could pin every fetch worker asleep at once and
+stall the whole request. With `RetryScheduler` a transient failure is
+parked on a timer instead: the worker moves on to the next candidate and the
+retry runs on the scheduler's pool once its delay has passed.
+
+Backoff is exponential with "equal jitter" (half fixed, half random), so
+retries from many candidates hitting the same outage spread out instead of
+arriving in waves. A `Retry-After` from the server wins over our backoff.
+
+Retry counts and delays are kept in `stats()`; the async fetch engine, which
+retries with `asyncio.sleep`, reports its retries here too via `note()`.
+"""
+from __future__ import annotations
+
+import heapq
+import itertools
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+# Backoff for attempt n is drawn from [d/2, d] with d = min(cap, base * 2**n).
+RETRY_BASE_S = float(os.environ.get("RETRY_BASE_S", "0.5"))
+RETRY_MAX_S = float(os.environ.get("RETRY_MAX_S", "8"))
+# Threads that run due retries (and, for match_faces, first attempts too).
+RETRY_WORKERS = int(os.environ.get("RETRY_WORKERS", "16"))
+
+
+class RetryLater(Exception):
+    """
+    A transient failure the caller should retry later rather than now.
+    `attempted=False` means nothing was sent (e.g. the host was busy or
+    cooling down), so the retry shouldn't count against the retry limit.
+    """
+
+    def __init__(
+        self, reason: str, retry_after: Optional[float] = None, attempted: bool = True
+    ) -> None:
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+        self.attempted = attempted
+
+
+def backoff_delay(
+    attempt: int,
+    retry_after: Optional[float] = None,
+    base: float = RETRY_BASE_S,
+    cap: float = RETRY_MAX_S,
+) -> float:
+    """Delay before retry number `attempt` (0-based)."""
+    if retry_after is not None:
+        return max(0.0, retry_after)
+    ceiling = min(cap, base * (2 ** attempt))
+    return ceiling / 2 + random.uniform(0, ceiling / 2)
+
+
+class RetryScheduler:
+    """A timer heap plus a thread pool that runs callbacks once they are due."""
+
+    def __init__(self, workers: int = RETRY_WORKERS) -> None:
+        self.workers = max(1, int(workers))
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="retry")
+        self._heap: List[Tuple[float, int, Callable[[], None]]] = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._counts: Dict[str, float] = {
+            "scheduled": 0,
+            "fired": 0,
+            "total_delay_s": 0.0,
+            "max_delay_s": 0.0,
+        }
+        self._reasons: Dict[str, int] = {}
+        threading.Thread(target=self._run, name="retry-timer", daemon=True).start()
+
+    def submit(self, fn: Callable[[], None]) -> None:
+        """Run `fn` on the pool now."""
+        self._executor.submit(fn)
+
+    def schedule(self, delay: float, fn: Callable[[], None], reason: str = "") -> None:
+        """Run `fn` on the pool after `delay` seconds."""
+        self.note(delay, reason)
+        with self._cond:
+            heapq.heappush(self._heap, (time.monotonic() + delay, next(self._seq), fn))
+            self._cond.notify()
+
+    def note(self, delay: float, reason: str = "") -> None:
+        """Count a retry in the metrics without scheduling anything."""
+        with self._cond:
+            self._counts["scheduled"] += 1
+            self._counts["total_delay_s"] += delay
+            self._counts["max_delay_s"] = max(self._counts["max_delay_s"], delay)
+            if reason:
+                self._reasons[reason] = self._reasons.get(reason, 0) + 1
+
+    def stats(self) -> Dict[str, object]:
+        with self._cond:
+            out: Dict[str, object] = dict(self._counts)
+            out["pending"] = len(self._heap)
+            out["total_delay_s"] = round(self._counts["total_delay_s"], 3)
+            out["max_delay_s"] = round(self._counts["max_delay_s"], 3)
+            out["reasons"] = dict(self._reasons)
+            return out
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._heap:
+                    self._cond.wait()
+                due, _, fn = self._heap[0]
+                wait = due - time.monotonic()
+                if wait > 0:
+                    self._cond.wait(wait)
+                    continue
+                heapq.heappop(self._heap)
+                self._counts["fired"] += 1
+            self._executor.submit(fn)
+
+
+_scheduler: Optional[RetryScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> RetryScheduler:
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = RetryScheduler()
+    return _scheduler
+
+
+def retry_stats() -> Dict[str, object]:
+    return get_scheduler().stats() if _scheduler is not None else {}
@@ -0,0 +1,171 @@
+"""
+Persistent cache of image-search results per (source, query, limit).
+
+Why: every `/upload` re-ran every source x query combination, although users
+refine and resubmit the same name over and over. The search phase cost 3-8 s
+each time, SerpApi calls cost quota, and repeated Bing scrapes get us
+rate-limited.
+
+- Keys are the source name, the normalized query (case and whitespace
+  folded) and the result limit; values are the JSON-encoded result list.
+- Each source has its own TTL (SEARCH_CACHE_TTL_S, with SEARCH_CACHE_TTLS
+  overrides). Google results come from paid quota and change slowly, so they
+  are kept longest by default.
+- Stale-while-revalidate: for SEARCH_CACHE_STALE_S past its TTL an entry is
+  still served, and a background refresh replaces it for the next request.
+- Empty result lists are not cached: the search modules return [] on errors
+  too, and a transient failure shouldn't stick for hours.
+
+Stored in a `TtlStore` (ttl_store.py), so gunicorn workers share it.
+"""
+from __future__ import annotations
+
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from ttl_store import TtlStore
+
+
+SearchFn = Callable[..., List[Dict[str, str]]]
+
+SEARCH_CACHE_PATH = os.environ.get("SEARCH_CACHE_PATH", "cache/search.sqlite3")
+SEARCH_CACHE_TTL_S = float(os.environ.get("SEARCH_CACHE_TTL_S", str(6 * 3600)))
+SEARCH_CACHE_STALE_S = float(os.environ.get("SEARCH_CACHE_STALE_S", str(3 * 86400)))
+SEARCH_CACHE_MAX_ENTRIES = int(os.environ.get("SEARCH_CACHE_MAX_ENTRIES", "20000"))
+
+# Per-source TTLs, matched against the start of the lowercased source name.
+_BUILTIN_TTLS = {
+    "google": 24 * 3600.0,
+}
+
+
+def _parse_ttls(raw: str) -> Dict[str, float]:
+    # "bing=3600,google=86400"
+    ttls: Dict[str, float] = {}
+    for part in raw.split(","):
+        name, _, value = part.partition("=")
+        try:
+            ttls[name.strip().lower()] = float(value)
+        except ValueError:
+            continue
+    return ttls
+
+
+_TTLS = {**_BUILTIN_TTLS, **_parse_ttls(os.environ.get("SEARCH_CACHE_TTLS", ""))}
+
+# Background refreshes of stale entries.
+_REFRESH_WORKERS = 4
+
+
+def source_ttl(source: str) -> float:
+    name = source.lower()
+    for prefix, ttl in _TTLS.items():
+        if prefix and name.startswith(prefix):
+            return ttl
+    return SEARCH_CACHE_TTL_S
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
+
+
+class SearchCache:
+    def __init__(self, store: TtlStore) -> None:
+        self._store = store
+        self._refresh_pool = ThreadPoolExecutor(
+            max_workers=_REFRESH_WORKERS, thread_name_prefix="search-refresh"
+        )
+        self._refreshing: Set[str] = set()
+        self._lock = threading.Lock()
+
+    def search(
+        self, source: str, fn: SearchFn, query: str, max_images: int
+    ) -> Tuple[List[Dict[str, str]], str]:
+        """
+        Results for `fn(query=query, max_images=max_images)` plus how they
+        were served: "hit", "stale" (a refresh is running) or "miss".
+        """
+        key = json.dumps([source, normalize_query(query), max_images])
+        entry = self._store.get(key)
+        if entry is not None:
+            try:
+                results = json.loads(entry.value)
+            except ValueError:
+                results = None
+            if results is not None:
+                if entry.fresh:
+                    return results, "hit"
+                self._refresh(key, source, fn, query, max_images)
+                return results, "stale"
+        return self._fetch(key, source, fn, query, max_images), "miss"
+
+    def stats(self) -> Dict[str, int]:
+        return self._store.stats()
+
+    def _fetch(
+        self, key: str, source: str, fn: SearchFn, query: str, max_images: int
+    ) -> List[Dict[str, str]]:
+        results = fn(query=query, max_images=max_images)
+        if results:
+            self._store.put(key, json.dumps(results), source_ttl(source))
+        return results
+
+    def _refresh(self, key: str, source: str, fn: SearchFn, query: str, max_images: int) -> None:
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def _run() -> None:
+            try:
+                self._fetch(key, source, fn, query, max_images)
+            except Exception as e:
+                print(f"[SearchCache] Refresh of {source} '{query}' failed: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        self._refresh_pool.submit(_run)
+
+
+_search_cache: Optional[SearchCache] = None
+_search_cache_failed = False
+_search_cache_lock = threading.Lock()
+
+
+def get_search_cache() -> Optional[SearchCache]:
+    """Shared cache, opened on first use. None when disabled or unavailable."""
+    global _search_cache, _search_cache_failed
+    if _search_cache is None and SEARCH_CACHE_PATH and not _search_cache_failed:
+        with _search_cache_lock:
+            if _search_cache is None and not _search_cache_failed:
+                try:
+                    _search_cache = SearchCache(
+                        TtlStore(
+                            SEARCH_CACHE_PATH,
+                            max_entries=SEARCH_CACHE_MAX_ENTRIES,
+                            stale_s=SEARCH_CACHE_STALE_S,
+                            name="SearchCache",
+                        )
+                    )
+                except Exception as e:
+                    _search_cache_failed = True
+                    print(f"[SearchCache] Warning: search cache disabled ({e})")
+    return _search_cache
+
+
+def cached_search(
+    source: str, fn: SearchFn, query: str, max_images: int
+) -> Tuple[List[Dict[str, str]], str]:
+    """`SearchCache.search` on the shared cache; "off" when it's disabled."""
+    cache = get_search_cache()
+    if cache is None:
+        return fn(query=query, max_images=max_images), "off"
+    return cache.search(source, fn, query, max_images)
+
+
+def search_cache_stats() -> Dict[str, int]:
+    return _search_cache.stats() if _search_cache is not None else {}
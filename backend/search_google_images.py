@@ -2,11 +2,226 @@
 Google Images search via SerpApi.
 Returns image URLs and page URLs for face matching and takedown flows.
 Set SERPAPI_API_KEY in .env to enable (optional; search still works with Bing + DuckDuckGo if unset).
+
+Why: this used a bare `requests.get` with a 30 s timeout, so every call paid
+a fresh TLS handshake, one stalled request held the whole upload for up to
+30 s, and a single transient 5xx lost Google for that query. Google is the
+slowest source and the one most often holding up requests.
+
+- Requests go through the shared pooled session (http_client.get_session),
+  with a shorter timeout (SERPAPI_TIMEOUT_S) and SERPAPI_RETRIES retries on
+  network errors and 5xx, backing off like the fetch path.
+- SerpApi returns at most `_PAGE_SIZE` images per page; when `max_images`
+  needs more, the extra `ijn` pages are fetched concurrently.
+- Every page is one search off the account's quota. `SerpApiQuota` keeps
+  the remaining monthly and hourly searches (read in the background from
+  SerpApi's account endpoint, which is free, and counted down locally in
+  between) and skips searches once fewer than SERPAPI_QUOTA_RESERVE are
+  left, instead of running into the account limit. A 429 (out of searches
+  or over the hourly limit) pauses Google until the account endpoint shows
+  headroom again.
 """
+from __future__ import annotations
+
 import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
 import requests
 
+from http_client import get_session, parse_retry_after
+from retry_scheduler import backoff_delay
+
 SERPAPI_BASE = "https://serpapi.com/search"
+SERPAPI_ACCOUNT_URL = "https://serpapi.com/account"
+
+# SerpApi fetches Google live, so a read takes a few seconds; past this it is
+# usually stuck and a retry does better.
+SERPAPI_TIMEOUT_S = float(os.environ.get("SERPAPI_TIMEOUT_S", "12"))
+SERPAPI_RETRIES = int(os.environ.get("SERPAPI_RETRIES", "1"))
+# Searches kept in hand, monthly and hourly; 0 searches until SerpApi refuses.
+SERPAPI_QUOTA_RESERVE = int(os.environ.get("SERPAPI_QUOTA_RESERVE", "20"))
+# How often the remaining quota is re-read from the account endpoint.
+SERPAPI_ACCOUNT_REFRESH_S = float(os.environ.get("SERPAPI_ACCOUNT_REFRESH_S", "300"))
+
+_CONNECT_TIMEOUT_S = 3.05
+# Images per `ijn` page, and the most pages fetched for one query.
+_PAGE_SIZE = 100
+_MAX_PAGES = 3
+_RETRY_STATUSES = (500, 502, 503, 504)
+
+
+class SerpApiQuota:
+    """
+    Remaining SerpApi searches for one API key. Figures come from the account
+    endpoint every SERPAPI_ACCOUNT_REFRESH_S, read on a background thread so
+    searches never wait for it, and are counted down locally in between;
+    while they are unknown (first search, endpoint unreachable), nothing is
+    held back.
+    """
+
+    def __init__(
+        self,
+        api_key: str,
+        reserve: int = SERPAPI_QUOTA_RESERVE,
+        refresh_s: float = SERPAPI_ACCOUNT_REFRESH_S,
+    ) -> None:
+        self._api_key = api_key
+        self._reserve = max(0, reserve)
+        self._refresh_s = refresh_s
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self._refreshed_at = 0.0
+        self._searches_left: Optional[int] = None
+        self._hour_left: Optional[int] = None
+        self._blocked_until = 0.0
+        self._counts = {"searches": 0, "throttled": 0, "rate_limited": 0}
+
+    def acquire(self, searches: int) -> int:
+        """How many of `searches` may run now (0 = throttled); they're counted as used."""
+        self._maybe_refresh()
+        with self._lock:
+            allowed = searches
+            if time.time() < self._blocked_until:
+                allowed = 0
+            for left in (self._searches_left, self._hour_left):
+                if left is not None:
+                    allowed = min(allowed, max(0, left - self._reserve))
+            if allowed < searches:
+                self._counts["throttled"] += 1
+            self._spend(allowed)
+            return allowed
+
+    def rate_limited(self, retry_after: Optional[float]) -> None:
+        """SerpApi answered 429: stop until it says, or the account shows headroom."""
+        with self._lock:
+            self._counts["rate_limited"] += 1
+            self._blocked_until = time.time() + (
+                retry_after if retry_after is not None else self._refresh_s
+            )
+            # Re-read the account on the next search rather than trusting counts.
+            self._refreshed_at = 0.0
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                **self._counts,
+                "searches_left": self._searches_left,
+                "hour_searches_left": self._hour_left,
+                "blocked_s": round(max(0.0, self._blocked_until - time.time()), 1),
+            }
+
+    def _spend(self, searches: int) -> None:
+        self._counts["searches"] += searches
+        if self._searches_left is not None:
+            self._searches_left -= searches
+        if self._hour_left is not None:
+            self._hour_left -= searches
+
+    def _maybe_refresh(self) -> None:
+        with self._lock:
+            if self._refreshing or time.time() - self._refreshed_at < self._refresh_s:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._refresh, name="serpapi-account", daemon=True).start()
+
+    def _refresh(self) -> None:
+        account = None
+        try:
+            resp = get_session().get(
+                SERPAPI_ACCOUNT_URL,
+                params={"api_key": self._api_key},
+                timeout=(_CONNECT_TIMEOUT_S, SERPAPI_TIMEOUT_S),
+            )
+            if resp.status_code == 200:
+                account = resp.json()
+            else:
+                print(f"[Search] SerpApi account check returned HTTP {resp.status_code}")
+        except (requests.RequestException, ValueError) as e:
+            print(f"[Search] SerpApi account check failed: {e}")
+        with self._lock:
+            self._refreshing = False
+            self._refreshed_at = time.time()
+            if not isinstance(account, dict):
+                return
+            self._searches_left = _as_int(account.get("total_searches_left"))
+            hourly = _as_int(account.get("account_rate_limit_per_hour"))
+            used = _as_int(account.get("this_hour_searches"))
+            self._hour_left = hourly - used if hourly and used is not None else None
+            if self._searches_left is not None and self._searches_left > self._reserve and (
+                self._hour_left is None or self._hour_left > self._reserve
+            ):
+                self._blocked_until = 0.0
+
+
+def _as_int(value) -> Optional[int]:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+_quotas: Dict[str, SerpApiQuota] = {}
+_quotas_lock = threading.Lock()
+
+
+def _quota_for(api_key: str) -> SerpApiQuota:
+    with _quotas_lock:
+        quota = _quotas.get(api_key)
+        if quota is None:
+            quota = _quotas[api_key] = SerpApiQuota(api_key)
+        return quota
+
+
+def serpapi_quota_stats() -> Dict[str, object]:
+    """Quota figures for the configured SERPAPI_API_KEY; {} before its first search."""
+    quota = _quotas.get(os.environ.get("SERPAPI_API_KEY") or "")
+    return quota.stats() if quota is not None else {}
+
+
+def _fetch_page(query: str, page: int, num: int, key: str, quota: SerpApiQuota) -> Optional[list]:
+    """`images_results` of one `ijn` page; None if the request failed."""
+    params = {
+        "engine": "google_images",
+        "q": query,
+        "api_key": key,
+        "num": num,
+        "ijn": page,
+    }
+    session = get_session()
+    for attempt in range(SERPAPI_RETRIES + 1):
+        try:
+            resp = session.get(
+                SERPAPI_BASE, params=params, timeout=(_CONNECT_TIMEOUT_S, SERPAPI_TIMEOUT_S)
+            )
+        except requests.RequestException as e:
+            reason = f"request error: {e}"
+        else:
+            if resp.status_code == 429:
+                quota.rate_limited(parse_retry_after(resp.headers.get("Retry-After")))
+                print("[Search] Google Images paused: SerpApi rate limit or quota reached")
+                return None
+            if resp.status_code not in _RETRY_STATUSES:
+                try:
+                    data = resp.json()
+                except ValueError:
+                    data = {}
+                if resp.status_code != 200:
+                    print(
+                        f"[Search] Google Images returned HTTP {resp.status_code}: "
+                        f"{data.get('error', '')}"
+                    )
+                    return None
+                # An empty page comes back as 200 with an "error" message.
+                return data.get("images_results") or []
+            reason = f"HTTP {resp.status_code}"
+        if attempt >= SERPAPI_RETRIES:
+            print(f"[Search] Google Images page {page} failed: {reason}")
+            return None
+        time.sleep(backoff_delay(attempt))
+    return None
 
 
 def search_images_google(query: str, max_images: int = 10, api_key: str = None) -> list:
@@ -28,36 +243,47 @@ def search_images_google(query: str, max_images: int = 10, api_key: str = None)
 
     try:
         print(f"[Search] Searching Google Images for: '{query}'")
-        params = {
-            "engine": "google_images",
-            "q": query,
-            "api_key": key,
-            "num": min(max_images, 100),
-        }
-        resp = requests.get(SERPAPI_BASE, params=params, timeout=30)
-        resp.raise_for_status()
-        data = resp.json()
+        quota = _quota_for(key)
+        wanted_pages = min(_MAX_PAGES, max(1, -(-max_images // _PAGE_SIZE)))
+        pages = quota.acquire(wanted_pages)
+        if not pages:
+            print("[Search] Google Images skipped: SerpApi quota reserve reached")
+            return []
+        num = min(max_images, _PAGE_SIZE)
+        if pages == 1:
+            page_results = [_fetch_page(query, 0, num, key, quota)]
+        else:
+            with ThreadPoolExecutor(max_workers=pages) as pool:
+                page_results = list(
+                    pool.map(lambda page: _fetch_page(query, page, num, key, quota), range(pages))
+                )
 
         # SerpApi returns images in "images_results" with "image" (URL) and "link" (page)
-        raw = data.get("images_results") or []
+        raw: List[dict] = []
+        for items in page_results:
+            if not items:
+                # Failed page or no more results; later pages don't follow on.
+                break
+            raw.extend(items)
         results = []
-        for i, item in enumerate(raw[:max_images]):
+        seen_urls = set()
+        for item in raw:
             image_url = item.get("image") or item.get("original")
             link = item.get("link") or image_url
             title = item.get("title") or ""
-            if not image_url:
+            if not image_url or image_url in seen_urls:
                 continue
+            seen_urls.add(image_url)
             results.append({
                 "url": image_url,
                 "page_url": link,
-                "title": title or f"Google Images result {i + 1}",
+                "title": title or f"Google Images result {len(results) + 1}",
                 "source": "Google Images",
             })
+            if len(results) >= max_images:
+                break
         print(f"[Search] Google Images returned {len(results)} results")
         return results
-    except requests.RequestException as e:
-        print(f"[Search] Google Images request error: {e}")
-        return []
     except Exception as e:
         print(f"[Search] Google Images error: {e}")
         import traceback
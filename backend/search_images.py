@@ -6,13 +6,17 @@ unified, parallelized pipeline in face_recognition.py. The previous
 implementation used bing-image-downloader, which (1) tried to download every
 URL inline, (2) failed noisily on Instagram crawler URLs and CDN 403s, and
 (3) paginated up to 16 pages looking for valid images. We replace it with a
-single HTML scrape of Bing's async images endpoint.
+single HTML scrape of Bing's async images endpoint; when one page isn't
+enough the pages are fetched concurrently.
 """
 from __future__ import annotations
 
+import html
+import json
 import re
 import urllib.parse
-from typing import List, Dict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
 
 from http_client import get_session, DEFAULT_TIMEOUT
 
@@ -23,100 +27,174 @@ BING_HEADERS = {
     "Accept-Language": "en-US,en;q=0.9",
 }
 
-# Bing embeds the JSON blob for each tile as HTML-entity-encoded attributes;
-# "murl" is the original media URL and "purl" is the page that hosts it.
-_MURL_RE = re.compile(r"murl&quot;:&quot;(.*?)&quot;")
-_PURL_RE = re.compile(r"purl&quot;:&quot;(.*?)&quot;")
-_TITLE_RE = re.compile(r"t&quot;:&quot;(.*?)&quot;")
+# Each result tile is an `<a class="iusc" ... m="..." mad="...">` whose `m`
+# attribute holds the tile's metadata as HTML-entity-encoded JSON ("murl" is
+# the original media URL, "purl" the page that hosts it, "turl" Bing's
+# thumbnail, "t" the title); `mad` repeats the thumbnail URL. The tile's
+# caption follows, e.g. "1080 × 1350 · 156 kB · jpeg". Cutting the page at
+# each tile marker keeps every field on the tile it belongs to, and plain
+# `str.find`s within a tile are much cheaper than regexes over the page.
+_TILE_MARKER = 'class="iusc"'
+_CAPTION_MARKER = 'class="img_info'
+_CAPTION_OPEN = '<span class="nowrap">'
+_DIMENSIONS_RE = re.compile(r"(\d+)\s*[x\u00d7]\s*(\d+)")
+_FILE_SIZE_RE = re.compile(r"([\d.]+)\s*(B|KB|kB|MB)\b")
+_SIZE_UNITS = {"B": 1, "KB": 1024, "kB": 1024, "MB": 1024 * 1024}
+
+# Bing's async endpoint serves at most this many tiles per page, whatever
+# `count` asks for.
+_PAGE_SIZE = 35
+# Never fetch more than this many pages for one query.
+_MAX_PAGES = 3
+
+
+def _attr(tile_html: str, name: str) -> Optional[str]:
+    start = tile_html.find(f' {name}="')
+    if start < 0:
+        return None
+    start += len(name) + 3
+    end = tile_html.find('"', start)
+    return tile_html[start:end] if end >= 0 else None
+
+
+def _json_attr(raw: Optional[str]) -> Dict[str, Any]:
+    if not raw:
+        return {}
+    # Bing normally encodes only quotes and ampersands; the general (and
+    # much slower) unescape is for anything else.
+    text = raw.replace("&quot;", '"')
+    if "&" in text:
+        if text.count("&") == text.count("&amp;"):
+            text = text.replace("&amp;", "&")
+        else:
+            text = html.unescape(text)
+    try:
+        value = json.loads(text)
+    except ValueError:
+        return {}
+    return value if isinstance(value, dict) else {}
+
+
+def _caption(tile_html: str) -> Optional[str]:
+    start = tile_html.find(_CAPTION_MARKER)
+    if start < 0:
+        return None
+    start = tile_html.find(_CAPTION_OPEN, start)
+    if start < 0:
+        return None
+    start += len(_CAPTION_OPEN)
+    end = tile_html.find("<", start)
+    return tile_html[start:end] if end >= 0 else None
+
+
+def _apply_caption(tile: Dict[str, Any], caption: str) -> None:
+    if "&" in caption:
+        caption = html.unescape(caption)
+    dims = _DIMENSIONS_RE.search(caption)
+    if dims:
+        tile["width"], tile["height"] = int(dims.group(1)), int(dims.group(2))
+    size = _FILE_SIZE_RE.search(caption)
+    if size:
+        tile["file_size"] = int(float(size.group(1)) * _SIZE_UNITS[size.group(2)])
+
+
+def _parse_tiles(page: str) -> List[Dict[str, Any]]:
+    """
+    Parse Bing's async-images HTML into tiles: `url`, `page_url`, `title`,
+    `thumbnail_url`, and the original's `width`, `height` and `file_size`
+    (bytes) when Bing shows them. Tiles without a media URL are skipped.
+    """
+    tiles: List[Dict[str, Any]] = []
+    for tile_html in page.split(_TILE_MARKER)[1:]:
+        meta = _json_attr(_attr(tile_html, "m"))
+        murl = meta.get("murl")
+        if not murl:
+            continue
+        tile: Dict[str, Any] = {
+            "url": murl,
+            "page_url": meta.get("purl") or murl,
+            "title": meta.get("t") or f"Bing result {len(tiles) + 1}",
+            "thumbnail_url": meta.get("turl") or _json_attr(_attr(tile_html, "mad")).get("turl"),
+            "width": None,
+            "height": None,
+            "file_size": None,
+        }
+        caption = _caption(tile_html)
+        if caption:
+            _apply_caption(tile, caption)
+        tiles.append(tile)
+    return tiles
 
 
-def _decode(s: str) -> str:
-    return (
-        s.replace("&amp;", "&")
-        .replace("&quot;", '"')
-        .replace("\\u0026", "&")
-        .replace("\\/", "/")
-    )
+def _fetch_page(session, query: str, page: int) -> Optional[List[Dict[str, Any]]]:
+    """Tiles on one result page; None if the request failed."""
+    params = {
+        "q": query,
+        "first": page * _PAGE_SIZE,
+        "count": _PAGE_SIZE,
+        "adlt": "off",
+    }
+    try:
+        resp = session.get(
+            BING_ASYNC_URL,
+            params=params,
+            headers=BING_HEADERS,
+            timeout=DEFAULT_TIMEOUT,
+        )
+    except Exception as e:
+        print(f"[Search] Bing request failed: {e}")
+        return None
+    if resp.status_code != 200:
+        print(f"[Search] Bing returned HTTP {resp.status_code}")
+        return None
+    return _parse_tiles(resp.text)
 
 
-def _parse_tiles(html: str) -> List[Dict[str, str]]:
-    """
-    Parse Bing's async-images HTML for image tiles. Each tile is represented
-    by a JSON blob embedded as HTML-encoded attributes. We grab `murl`,
-    `purl`, and `t` (title) position-aligned.
-    """
-    murls = _MURL_RE.findall(html)
-    purls = _PURL_RE.findall(html)
-    titles = _TITLE_RE.findall(html)
-
-    tiles: List[Dict[str, str]] = []
-    for i, murl in enumerate(murls):
-        tiles.append(
-            {
-                "url": _decode(murl),
-                "page_url": _decode(purls[i]) if i < len(purls) else _decode(murl),
-                "title": _decode(titles[i]) if i < len(titles) else f"Bing result {i + 1}",
-            }
-        )
-    return tiles
+def _fetch_pages(session, query: str, pages: range) -> List[Optional[List[Dict[str, Any]]]]:
+    if len(pages) == 1:
+        return [_fetch_page(session, query, pages[0])]
+    with ThreadPoolExecutor(max_workers=len(pages)) as pool:
+        return list(pool.map(lambda page: _fetch_page(session, query, page), pages))
 
 
-def search_images_bing(query: str = "person", max_images: int = 10) -> List[Dict[str, str]]:
+def search_images_bing(query: str = "person", max_images: int = 10) -> List[Dict[str, Any]]:
     """
-    Return a list of `{url, page_url, title, source}` dicts for a Bing image
-    search. No disk I/O, no downloads.
+    Return a list of `{url, page_url, title, source, thumbnail_url, width,
+    height, file_size}` dicts for a Bing image search (the last four may be
+    None). No disk I/O, no downloads.
+
+    Fetches as many pages as `max_images` calls for (with headroom for
+    duplicates) concurrently, and the remaining pages up to `_MAX_PAGES`
+    only if those came up short.
     """
     try:
         print(f"[Search] Searching Bing for: '{query}'")
         session = get_session()
 
-        results: List[Dict[str, str]] = []
+        results: List[Dict[str, Any]] = []
         seen_urls = set()
-        # Stop after 3 pages if we still don't have enough - prevents the
-        # 16-page hunt seen in the old terminal logs.
-        max_pages = 3
-        for page in range(max_pages):
-            params = {
-                "q": query,
-                "first": page * 30,
-                "count": max(max_images * 2, 30),
-                "adlt": "off",
-            }
-            try:
-                resp = session.get(
-                    BING_ASYNC_URL,
-                    params=params,
-                    headers=BING_HEADERS,
-                    timeout=DEFAULT_TIMEOUT,
-                )
-            except Exception as e:
-                print(f"[Search] Bing request failed: {e}")
-                break
-            if resp.status_code != 200:
-                print(f"[Search] Bing returned HTTP {resp.status_code}")
-                break
-
-            tiles = _parse_tiles(resp.text)
-            if not tiles:
-                # No more results.
-                break
-
-            for t in tiles:
-                if t["url"] in seen_urls:
-                    continue
-                seen_urls.add(t["url"])
-                results.append(
-                    {
-                        "url": t["url"],
-                        "page_url": t.get("page_url") or t["url"],
-                        "title": t.get("title") or "Bing result",
-                        "source": "Bing Images",
-                    }
-                )
+        # Over-fetch 2x: duplicates and blocklisted URLs are dropped later.
+        wanted_pages = min(_MAX_PAGES, max(1, -(-max_images * 2 // _PAGE_SIZE)))
+        batches = [range(0, wanted_pages), range(wanted_pages, _MAX_PAGES)]
+        for batch in batches:
+            if not batch:
+                continue
+            exhausted = False
+            for tiles in _fetch_pages(session, query, batch):
+                if not tiles:
+                    # Failed request or no more results.
+                    exhausted = True
+                    break
+                for t in tiles:
+                    if t["url"] in seen_urls:
+                        continue
+                    seen_urls.add(t["url"])
+                    results.append({**t, "source": "Bing Images"})
+                    if len(results) >= max_images:
+                        break
                 if len(results) >= max_images:
                     break
-
-            if len(results) >= max_images:
+            if exhausted or len(results) >= max_images:
                 break
 
         print(f"[Search] Bing returned {len(results)} URLs")
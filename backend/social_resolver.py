@@ -13,14 +13,29 @@ This module:
 - Upgrades them to the real CDN URL by fetching the HTML (with a browser UA +
   appropriate Referer) and parsing og:image.
 - Falls back to the same og:image behavior for any generic page URL.
+- Remembers each page -> og:image resolution on disk (ttl_store.py), so the
+  same crawler URL coming back from Bing on a later day costs one request
+  instead of two. Entries expire no later than the CDN URL's signature.
+- Offers the same resolution on the asyncio fetch engine (async_fetch.py)
+  for callers that run many downloads from one event loop, and a deferred
+  variant whose retries wait on a timer instead of a thread
+  (retry_scheduler.py).
 """
 from __future__ import annotations
 
+import asyncio
+import os
 import re
-from typing import Optional
-from urllib.parse import urlsplit
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Generator, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
 
-from http_client import fetch_bytes
+from async_fetch import AsyncFetcher, get_fetcher
+from http_client import fetch_bytes, known_failure, known_permanent_failure, remember_failure
+from retry_scheduler import RetryLater, RetryScheduler, backoff_delay, get_scheduler
+from ttl_store import TtlStore
 
 
 # Instagram's lookaside crawler endpoint only serves the SEO page (with the
@@ -38,14 +53,22 @@ def _crawler_user_agent(url: str) -> Optional[str]:
     return None
 
 
+# Bytes patterns, so landing pages are searched without decoding them first.
 _OG_IMAGE_RE = re.compile(
-    r"""<meta\s+[^>]*property\s*=\s*["']og:image(?::secure_url)?["'][^>]*content\s*=\s*["']([^"']+)["']""",
+    rb"""<meta\s+[^>]*property\s*=\s*["']og:image(?::secure_url)?["'][^>]*content\s*=\s*["']([^"']+)["']""",
     re.IGNORECASE | re.DOTALL,
 )
 _OG_IMAGE_RE_REVERSED = re.compile(
-    r"""<meta\s+[^>]*content\s*=\s*["']([^"']+)["'][^>]*property\s*=\s*["']og:image(?::secure_url)?["']""",
+    rb"""<meta\s+[^>]*content\s*=\s*["']([^"']+)["'][^>]*property\s*=\s*["']og:image(?::secure_url)?["']""",
     re.IGNORECASE | re.DOTALL,
 )
+# og:image always sits in <head>, so a landing page is only read up to the
+# first complete og:image tag or the end of <head>, whichever comes first
+# (`stop_at` in `fetch_bytes`). Facebook and news pages run to megabytes.
+_HEAD_DONE_RE = re.compile(
+    rb"""<meta\s[^>]*["']og:image(?::secure_url)?["'][^>]*>|</head\s*>""",
+    re.IGNORECASE,
+)
 
 
 def is_social_crawler_url(url: str) -> bool:
@@ -62,14 +85,10 @@ def is_social_crawler_url(url: str) -> bool:
 
 
 def _extract_og_image(html: bytes) -> Optional[str]:
-    try:
-        text = html.decode("utf-8", errors="replace")
-    except Exception:
-        return None
-    m = _OG_IMAGE_RE.search(text) or _OG_IMAGE_RE_REVERSED.search(text)
+    m = _OG_IMAGE_RE.search(html) or _OG_IMAGE_RE_REVERSED.search(html)
     if not m:
         return None
-    og = m.group(1).strip()
+    og = m.group(1).decode("utf-8", errors="replace").strip()
     # Decode common HTML entities we actually encounter
     og = (
         og.replace("&amp;", "&")
@@ -89,6 +108,90 @@ def _referer_for(url: str) -> Optional[str]:
     return None
 
 
+# Page URL -> og:image URL. An empty RESOLVE_CACHE_PATH disables it.
+RESOLVE_CACHE_PATH = os.environ.get("RESOLVE_CACHE_PATH", "cache/og_resolve.sqlite3")
+RESOLVE_CACHE_TTL_S = float(os.environ.get("RESOLVE_CACHE_TTL_S", str(7 * 86400)))
+RESOLVE_CACHE_MAX_ENTRIES = int(os.environ.get("RESOLVE_CACHE_MAX_ENTRIES", "200000"))
+# Instagram/Facebook CDN URLs are signed; `oe` is the signature's expiry as a
+# hex unix timestamp, after which the CDN answers 403. Stop serving a cached
+# URL this long before that, and don't cache URLs that close to expiry at all.
+_SIGNATURE_MARGIN_S = 600
+
+_resolve_cache: Optional[TtlStore] = None
+_resolve_cache_failed = False
+_resolve_cache_lock = threading.Lock()
+# Cache writes run here: resolve plans also run on the async fetch engine's
+# event loop, where a SQLite write (which may wait on the database lock)
+# would stall every download. One thread keeps the writes in order.
+_resolve_cache_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="resolve-cache")
+
+
+def _get_resolve_cache() -> Optional[TtlStore]:
+    global _resolve_cache, _resolve_cache_failed
+    if _resolve_cache is None and RESOLVE_CACHE_PATH and not _resolve_cache_failed:
+        with _resolve_cache_lock:
+            if _resolve_cache is None and not _resolve_cache_failed:
+                try:
+                    _resolve_cache = TtlStore(
+                        RESOLVE_CACHE_PATH,
+                        max_entries=RESOLVE_CACHE_MAX_ENTRIES,
+                        name="ResolveCache",
+                    )
+                except Exception as e:
+                    _resolve_cache_failed = True
+                    print(f"[Resolver] Warning: resolution cache disabled ({e})")
+    return _resolve_cache
+
+
+def _signature_expiry(url: str) -> Optional[float]:
+    oe = parse_qs(urlsplit(url).query).get("oe")
+    if not oe:
+        return None
+    try:
+        return float(int(oe[0], 16))
+    except ValueError:
+        return None
+
+
+def _cached_resolution(url: str) -> Optional[str]:
+    cache = _get_resolve_cache()
+    entry = cache.get(url) if cache is not None else None
+    return entry.value if entry is not None and entry.fresh else None
+
+
+def _write_resolution(write: Callable[[TtlStore], None]) -> None:
+    def _run() -> None:
+        cache = _get_resolve_cache()
+        if cache is None:
+            return
+        try:
+            write(cache)
+        except Exception as e:
+            print(f"[Resolver] Resolution cache write failed: {e}")
+
+    _resolve_cache_writer.submit(_run)
+
+
+def _remember_resolution(url: str, og: str) -> None:
+    if not RESOLVE_CACHE_PATH:
+        return
+    ttl = RESOLVE_CACHE_TTL_S
+    expiry = _signature_expiry(og)
+    if expiry is not None:
+        ttl = min(ttl, expiry - time.time() - _SIGNATURE_MARGIN_S)
+    if ttl > 0:
+        _write_resolution(lambda cache: cache.put(url, og, ttl))
+
+
+def _forget_resolution(url: str) -> None:
+    if RESOLVE_CACHE_PATH:
+        _write_resolution(lambda cache: cache.delete(url))
+
+
+def resolve_cache_stats() -> Dict[str, int]:
+    return _resolve_cache.stats() if _resolve_cache is not None else {}
+
+
 def resolve_to_image_url(url: str) -> Optional[str]:
     """
     If `url` is a known crawler landing page (or returns HTML), fetch it and
@@ -96,11 +199,15 @@ def resolve_to_image_url(url: str) -> Optional[str]:
     """
     if not url:
         return None
+    cached = _cached_resolution(url)
+    if cached is not None:
+        return cached
     result = fetch_bytes(
         url,
         referer=_referer_for(url),
         allow_html=True,
         user_agent=_crawler_user_agent(url),
+        stop_at=_HEAD_DONE_RE,
     )
     if not result:
         return None
@@ -110,22 +217,56 @@ def resolve_to_image_url(url: str) -> Optional[str]:
         return url
     if "html" not in content_type:
         return None
+    # Not remembered here: only `_og_plan` does, once the og:image has
+    # actually served an image.
     return _extract_og_image(body)
 
 
-def fetch_image_bytes_with_resolve(url: str) -> Optional[bytes]:
-    """
-    High-level helper: return image bytes for `url`, resolving social crawler
-    URLs (or any HTML response) to their og:image first.
+# A resolve plan is a generator that yields `fetch_bytes` keyword arguments,
+# receives each fetch result back, and finally returns the image bytes. The
+# sync and async entry points below only differ in how they perform fetches,
+# so the resolution logic lives in one place.
+FetchPlan = Generator[Dict[str, Any], Optional[Tuple[bytes, str]], Optional[bytes]]
 
-    Returns None on permanent failure (404, 403, private content, etc.).
-    """
-    if not url:
+
+def _og_plan(url: str, og: str) -> FetchPlan:
+    """Fetch the og:image `og` found on `url`; the resolution is remembered
+    once it has actually served an image."""
+    result = yield dict(url=og, referer=_referer_for(og))
+    if result is None or not result[1].startswith("image/"):
         return None
+    _remember_resolution(url, og)
+    return result[0]
+
+
+def _cached_plan(url: str, og: Optional[str]) -> FetchPlan:
+    """Fetch `og`, the og:image remembered for `url`, if any. If it fails the
+    caller resolves afresh; the remembered URL is only forgotten when it
+    failed for good (4xx, not an image), not on a transient failure."""
+    if og is None:
+        return None
+    result = yield dict(url=og, referer=_referer_for(og))
+    if result is not None and result[1].startswith("image/"):
+        return result[0]
+    if result is not None or known_permanent_failure(og) is not None:
+        _forget_resolution(url)
+    return None
+
+
+def _resolve_plan(url: str) -> FetchPlan:
+    """Resolve plan for thread drivers: the cache lookup runs inline."""
+    return (yield from _resolve_plan_with(url, _cached_resolution(url)))
+
+
+def _resolve_plan_with(url: str, cached_og: Optional[str]) -> FetchPlan:
+    """Resolve plan given the caller's lookup of the remembered og:image."""
+    cached = yield from _cached_plan(url, cached_og)
+    if cached is not None:
+        return cached
 
     # Fast path: try to grab as an image directly.
     if not is_social_crawler_url(url):
-        first = fetch_bytes(url, allow_html=True)
+        first = yield dict(url=url, allow_html=True, stop_at=_HEAD_DONE_RE)
         if first is None:
             return None
         body, content_type = first
@@ -134,20 +275,18 @@ def fetch_image_bytes_with_resolve(url: str) -> Optional[bytes]:
         # HTML fallback - try og:image
         og = _extract_og_image(body)
         if not og:
+            remember_failure(url, "no og:image")
             return None
-        second = fetch_bytes(og, referer=_referer_for(og))
-        if second is None:
-            return None
-        body2, ct2 = second
-        return body2 if ct2.startswith("image/") else None
+        return (yield from _og_plan(url, og))
 
     # Known crawler URL: skip the wasted image fetch and go straight to HTML
     # with a crawler User-Agent (Instagram otherwise serves the client shell).
-    html_resp = fetch_bytes(
-        url,
+    html_resp = yield dict(
+        url=url,
         referer=_referer_for(url),
         allow_html=True,
         user_agent=_crawler_user_agent(url),
+        stop_at=_HEAD_DONE_RE,
     )
     if html_resp is None:
         return None
@@ -156,9 +295,136 @@ def fetch_image_bytes_with_resolve(url: str) -> Optional[bytes]:
         return html_body
     og = _extract_og_image(html_body)
     if not og:
+        remember_failure(url, "no og:image")
         return None
-    final = fetch_bytes(og, referer=_referer_for(og))
-    if final is None:
+    return (yield from _og_plan(url, og))
+
+
+def fetch_image_bytes_with_resolve(url: str) -> Optional[bytes]:
+    """
+    High-level helper: return image bytes for `url`, resolving social crawler
+    URLs (or any HTML response) to their og:image first.
+
+    Returns None on permanent failure (404, 403, private content, etc.), or
+    straight away for URLs that failed recently (see negative_cache.py).
+    """
+    if not url or known_failure(url) is not None:
         return None
-    body3, ct3 = final
-    return body3 if ct3.startswith("image/") else None
+    plan = _resolve_plan(url)
+    try:
+        request = next(plan)
+        while True:
+            request = plan.send(fetch_bytes(**request))
+    except StopIteration as done:
+        return done.value
+
+
+class _DeferredPlan:
+    """
+    Drives a resolve plan on a `RetryScheduler`: each fetch makes a single
+    attempt, and a transient failure parks the plan on the scheduler's timer
+    instead of sleeping, so the thread goes back to the pool.
+    """
+
+    def __init__(
+        self,
+        plan: FetchPlan,
+        scheduler: RetryScheduler,
+        max_retries: int,
+        on_retry: Optional[Callable[[float, str], None]],
+    ) -> None:
+        self.future: Future = Future()
+        self._plan = plan
+        self._scheduler = scheduler
+        self._max_retries = max_retries
+        self._on_retry = on_retry
+        self._request: Optional[Dict[str, Any]] = None
+        self._attempt = 0
+
+    def start(self) -> Future:
+        self._scheduler.submit(self._step)
+        return self.future
+
+    def _advance(self, result: Optional[Tuple[bytes, str]]) -> None:
+        try:
+            if self._request is None:
+                self._request = next(self._plan)
+            else:
+                self._request = self._plan.send(result)
+            self._attempt = 0
+        except StopIteration as done:
+            self._request = None
+            self.future.set_result(done.value)
+
+    def _step(self) -> None:
+        try:
+            if self._request is None:
+                self._advance(None)
+            while self._request is not None:
+                try:
+                    result = fetch_bytes(**self._request, defer_retries=True)
+                except RetryLater as e:
+                    if not e.attempted:
+                        # Host busy or cooling down: wait for it without
+                        # spending a retry.
+                        self._scheduler.schedule(e.retry_after or 0.0, self._step, e.reason)
+                        return
+                    if self._attempt >= self._max_retries:
+                        remember_failure(self._request["url"], e.reason, transient=True)
+                        result = None
+                    else:
+                        delay = backoff_delay(self._attempt, e.retry_after)
+                        self._attempt += 1
+                        if self._on_retry is not None:
+                            self._on_retry(delay, e.reason)
+                        self._scheduler.schedule(delay, self._step, e.reason)
+                        return
+                self._advance(result)
+        except Exception as e:
+            if not self.future.done():
+                self.future.set_exception(e)
+
+
+def fetch_image_bytes_with_resolve_deferred(
+    url: str,
+    scheduler: Optional[RetryScheduler] = None,
+    max_retries: int = 2,
+    on_retry: Optional[Callable[[float, str], None]] = None,
+) -> Future:
+    """
+    Non-blocking variant of `fetch_image_bytes_with_resolve`: returns a
+    Future for the image bytes (or None). Fetches run on the retry
+    scheduler's pool and retries wait on its timer, not in a thread.
+    `on_retry(delay, reason)` is called for every retry scheduled.
+    """
+    if not url:
+        done: Future = Future()
+        done.set_result(None)
+        return done
+    return _DeferredPlan(
+        _resolve_plan(url), scheduler or get_scheduler(), max_retries, on_retry
+    ).start()
+
+
+async def fetch_image_bytes_with_resolve_async(
+    url: str, fetcher: Optional[AsyncFetcher] = None
+) -> Optional[bytes]:
+    """
+    Async twin of `fetch_image_bytes_with_resolve`, using the shared
+    `AsyncFetcher` (or `fetcher`). Must run on that fetcher's event loop.
+    """
+    if not url:
+        return None
+    fetcher = fetcher or get_fetcher()
+    if fetcher is None:
+        raise RuntimeError("async fetch engine unavailable (aiohttp not installed)")
+    # A cache hit touches the entry (a SQLite write that can wait on the
+    # database lock), so look it up off the event loop.
+    cached_og = await asyncio.to_thread(_cached_resolution, url)
+    plan = _resolve_plan_with(url, cached_og)
+    try:
+        request = next(plan)
+        while True:
+            request = plan.send(await fetcher.fetch_bytes(**request))
+    except StopIteration as done:
+        return done.value
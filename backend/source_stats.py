@@ -0,0 +1,251 @@
+"""
+Per-source search latency and match yield, used to split the candidate budget
+and to hedge slow queries.
+
+Why: the candidate budget used to be split evenly across Bing, Google and
+DuckDuckGo, whatever each source's latency or how often its results actually
+matched. Every candidate costs a download and an
+embedding, so the fixed budget should go where matches come from.
+
+- Latency: the last `_LATENCY_SAMPLES` search durations per source (cache
+  hits excluded), reported as p50/p90.
+- Yield: matches per candidate, with exponentially decayed counts so the
+  estimate follows changes in a source's quality, and a prior so a source
+  with little history isn't starved. Runs where a source fed no candidates
+  (errors, empty results) only count as history, not as yield samples.
+- `shares()` weighs yield, discounted for slow sources (they deliver late,
+  often after matching has stopped). A source that has stopped delivering
+  candidates altogether weighs nothing. Every source stays above
+  SOURCE_BUDGET_MIN_SHARE so it keeps being measured, and until each has
+  `_MIN_SAMPLES` runs behind it, the split stays even. Callers leave out
+  sources that are switched off (e.g. Google without a SerpApi key).
+- Hedging: a search still running after the source's usual latency
+  (SEARCH_HEDGE_PERCENTILE, at least SEARCH_HEDGE_MIN_S) is re-issued, and
+  whichever call returns results first wins. Only sources listed in
+  SEARCH_HEDGE_SOURCES are hedged; SerpApi is left out by default because
+  every call costs quota.
+
+In memory and per process, like the negative cache.
+"""
+from __future__ import annotations
+
+import math
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+
+SearchFn = Callable[..., list]
+
+SOURCE_BUDGET_ADAPTIVE = os.environ.get("SOURCE_BUDGET_ADAPTIVE", "1") != "0"
+SOURCE_BUDGET_MIN_SHARE = float(os.environ.get("SOURCE_BUDGET_MIN_SHARE", "0.15"))
+SEARCH_HEDGE_PERCENTILE = float(os.environ.get("SEARCH_HEDGE_PERCENTILE", "90"))
+SEARCH_HEDGE_MIN_S = float(os.environ.get("SEARCH_HEDGE_MIN_S", "1.0"))
+# Matched against the start of the lowercased source name; empty disables.
+SEARCH_HEDGE_SOURCES = [
+    s.strip().lower()
+    for s in os.environ.get("SEARCH_HEDGE_SOURCES", "bing,duckduckgo").split(",")
+    if s.strip()
+]
+
+_LATENCY_SAMPLES = 200
+# Runs (or searches, for hedging) per source before its stats are trusted.
+_MIN_SAMPLES = 20
+# Below this many decayed candidates a source counts as not delivering.
+_MIN_CANDIDATES = 1.0
+# Yield prior: counts as 1 match in 10 candidates.
+_PRIOR_MATCHES = 1.0
+_PRIOR_CANDIDATES = 10.0
+# Old yield counts are multiplied by this on every new request.
+_YIELD_DECAY = 0.98
+# A source whose median latency is this long gets half the weight.
+_LATENCY_HALF_WEIGHT_S = 5.0
+
+
+def _start_search(fn: SearchFn, query: str, max_images: int) -> Tuple["Future[list]", float]:
+    """Run one search call on a thread of its own; returns its future and start time."""
+    future: "Future[list]" = Future()
+    started = threading.Event()
+    start = [0.0]
+
+    def _run() -> None:
+        start[0] = time.monotonic()
+        started.set()
+        try:
+            future.set_result(fn(query=query, max_images=max_images))
+        except BaseException as e:
+            future.set_exception(e)
+
+    future.set_running_or_notify_cancel()
+    threading.Thread(target=_run, name="search-hedge", daemon=True).start()
+    started.wait()
+    return future, start[0]
+
+
+def _percentile(samples: List[float], pct: float) -> float:
+    ordered = sorted(samples)
+    rank = min(len(ordered) - 1, max(0, math.ceil(pct / 100.0 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+class _Source:
+    __slots__ = (
+        "latencies", "candidates", "matches", "requests", "empty_runs", "hedges", "hedge_wins"
+    )
+
+    def __init__(self) -> None:
+        self.latencies: Deque[float] = deque(maxlen=_LATENCY_SAMPLES)
+        self.candidates = 0.0
+        self.matches = 0.0
+        self.requests = 0
+        self.empty_runs = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+
+class SourceStats:
+    def __init__(
+        self,
+        adaptive: bool = SOURCE_BUDGET_ADAPTIVE,
+        min_share: float = SOURCE_BUDGET_MIN_SHARE,
+        hedge_percentile: float = SEARCH_HEDGE_PERCENTILE,
+        hedge_min_s: float = SEARCH_HEDGE_MIN_S,
+        hedge_sources: Optional[List[str]] = None,
+    ) -> None:
+        self._adaptive = adaptive
+        self._min_share = max(0.0, min_share)
+        self._hedge_percentile = hedge_percentile
+        self._hedge_min_s = hedge_min_s
+        self._hedge_sources = SEARCH_HEDGE_SOURCES if hedge_sources is None else hedge_sources
+        self._sources: Dict[str, _Source] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, source: str) -> _Source:
+        entry = self._sources.get(source)
+        if entry is None:
+            entry = self._sources[source] = _Source()
+        return entry
+
+    def record_latency(self, source: str, seconds: float) -> None:
+        with self._lock:
+            self._get(source).latencies.append(seconds)
+
+    def record_yield(self, source: str, candidates: float, matches: int) -> None:
+        with self._lock:
+            entry = self._get(source)
+            if candidates <= 0:
+                entry.empty_runs += 1
+                return
+            entry.candidates = entry.candidates * _YIELD_DECAY + candidates
+            entry.matches = entry.matches * _YIELD_DECAY + matches
+            entry.requests += 1
+
+    def shares(self, sources: List[str]) -> Dict[str, float]:
+        """Fraction of the candidate budget for each of `sources` (sums to 1)."""
+        even = {s: 1.0 / len(sources) for s in sources} if sources else {}
+        if not self._adaptive or len(sources) < 2:
+            return even
+        with self._lock:
+            entries = [self._sources.get(s) for s in sources]
+            if any(e is None or e.requests + e.empty_runs < _MIN_SAMPLES for e in entries):
+                return even
+            weights = {}
+            for source, entry in zip(sources, entries):
+                if entry.candidates < _MIN_CANDIDATES:
+                    weights[source] = 0.0
+                    continue
+                weight = (entry.matches + _PRIOR_MATCHES) / (entry.candidates + _PRIOR_CANDIDATES)
+                if entry.latencies:
+                    p50 = _percentile(list(entry.latencies), 50)
+                    weight /= 1.0 + p50 / _LATENCY_HALF_WEIGHT_S
+                weights[source] = weight
+        total = sum(weights.values())
+        if not total:
+            return even
+        floor = min(self._min_share, 1.0 / len(sources))
+        spare = 1.0 - floor * len(sources)
+        return {s: floor + spare * w / total for s, w in weights.items()}
+
+    def hedge_delay(self, source: str) -> Optional[float]:
+        """How long to wait before hedging a search on `source`; None = never."""
+        name = source.lower()
+        if not any(name.startswith(prefix) for prefix in self._hedge_sources):
+            return None
+        with self._lock:
+            entry = self._sources.get(source)
+            if entry is None or len(entry.latencies) < _MIN_SAMPLES:
+                return None
+            usual = _percentile(list(entry.latencies), self._hedge_percentile)
+        return max(self._hedge_min_s, usual)
+
+    def timed(self, source: str, fn: SearchFn) -> SearchFn:
+        """Wrap a search function: record its latency, hedging when slow."""
+
+        def _search(query: str, max_images: int) -> list:
+            delay = self.hedge_delay(source)
+            if delay is not None:
+                return self._hedged(source, fn, query, max_images, delay)
+            start = time.monotonic()
+            results = fn(query=query, max_images=max_images)
+            self.record_latency(source, time.monotonic() - start)
+            return results
+
+        return _search
+
+    def _hedged(
+        self, source: str, fn: SearchFn, query: str, max_images: int, delay: float
+    ) -> list:
+        # Each call gets its own thread rather than a shared pool, so neither
+        # waits in a queue: the hedge delay and the recorded latency both
+        # count from when the first call actually started.
+        first, start = _start_search(fn, query, max_images)
+        done, _ = wait([first], timeout=delay)
+        if done:
+            self.record_latency(source, time.monotonic() - start)
+            return first.result()
+        print(f"[Search] {source} slower than {delay:.1f}s for '{query}'; hedging")
+        hedge, _ = _start_search(fn, query, max_images)
+        with self._lock:
+            self._get(source).hedges += 1
+        # First call with results wins; if both come back empty, so be it.
+        winner = first
+        pending = {first, hedge}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            found = [fut for fut in done if fut.exception() is None and fut.result()]
+            if found:
+                winner = found[0]
+                break
+        self.record_latency(source, time.monotonic() - start)
+        if winner is hedge:
+            with self._lock:
+                self._get(source).hedge_wins += 1
+        return winner.result()
+
+    def stats(self) -> Dict[str, Dict[str, object]]:
+        with self._lock:
+            out: Dict[str, Dict[str, object]] = {}
+            for source, entry in self._sources.items():
+                latencies = list(entry.latencies)
+                out[source] = {
+                    "requests": entry.requests,
+                    "empty_runs": entry.empty_runs,
+                    "yield": round(
+                        (entry.matches + _PRIOR_MATCHES) / (entry.candidates + _PRIOR_CANDIDATES), 4
+                    ) if entry.candidates >= _MIN_CANDIDATES else None,
+                    "p50_s": round(_percentile(latencies, 50), 3) if latencies else None,
+                    "p90_s": round(_percentile(latencies, 90), 3) if latencies else None,
+                    "hedges": entry.hedges,
+                    "hedge_wins": entry.hedge_wins,
+                }
+            return out
+
+
+_source_stats = SourceStats()
+
+
+def get_source_stats() -> SourceStats:
+    return _source_stats
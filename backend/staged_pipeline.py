@@ -0,0 +1,285 @@
+"""
+Minimal staged pipeline: worker pools connected by bounded queues.
+
+Why: running fetch -> decode -> detect -> embed serially inside one thread per
+candidate means a worker stuck on a slow download holds a slot that could be
+decoding, and inference idles while every worker waits on the network. With
+explicit stages each step gets its own concurrency (many fetchers, a few
+decoders, a handful of inference feeders) and the bounded queues between
+them provide backpressure, so both the NIC and the CPU stay busy.
+
+Semantics:
+- Each stage function takes an item and returns the item for the next stage,
+  or None to drop it. Exceptions drop the item too, after `on_error` runs.
+- Every input comes out of `results()` exactly once, as `(True, item)` when it
+  made it through the last stage or `(False, item)` when it was dropped, so
+  callers can count progress.
+- `stop()` makes workers abandon queued items; `results()` then returns.
+- A stage built with `max_inflight` is asynchronous: its function returns a
+  `concurrent.futures.Future` (e.g. a coroutine scheduled on an event loop)
+  instead of the item. One dispatcher thread keeps up to `max_inflight`
+  futures running and one collector thread forwards their results, so the
+  stage's concurrency costs no threads.
+"""
+from __future__ import annotations
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+
+_SENTINEL = object()
+
+# How often blocked puts/gets re-check the stop flag.
+_POLL_S = 0.2
+
+
+class Stage:
+    def __init__(
+        self,
+        name: str,
+        fn: Callable[[Any], Optional[Any]],
+        workers: int = 1,
+        maxsize: int = 0,
+        max_inflight: Optional[int] = None,
+    ) -> None:
+        self.name = name
+        self.fn = fn
+        self.max_inflight = max(1, int(max_inflight)) if max_inflight else None
+        # An async stage has exactly one dispatcher thread.
+        self.workers = 1 if self.max_inflight else max(1, int(workers))
+        self.queue: "queue.Queue[Any]" = queue.Queue(maxsize)
+        self.processed = 0
+        self.dropped = 0
+        self.max_depth = 0
+        self.inflight = 0
+        self._alive = self.workers
+        self._lock = threading.Lock()
+
+    def stats(self) -> Dict[str, int]:
+        out = {
+            "workers": self.workers,
+            "depth": self.queue.qsize(),
+            "max_depth": self.max_depth,
+            "processed": self.processed,
+            "dropped": self.dropped,
+        }
+        if self.max_inflight:
+            out["max_inflight"] = self.max_inflight
+            out["inflight"] = self.inflight
+        return out
+
+
+class StagedPipeline:
+    def __init__(
+        self,
+        stages: List[Stage],
+        on_error: Optional[Callable[[Any, Exception], None]] = None,
+        name: str = "pipeline",
+    ) -> None:
+        if not stages:
+            raise ValueError("StagedPipeline needs at least one stage")
+        self._stages = stages
+        self._on_error = on_error
+        self._name = name
+        # Unbounded: the consumer must never be able to stall the last stage.
+        self._out: "queue.Queue[Any]" = queue.Queue()
+        self._stop = threading.Event()
+
+    @property
+    def stopped(self) -> threading.Event:
+        return self._stop
+
+    def start(self, items: Iterable[Any]) -> None:
+        """Start all workers plus a feeder thread that pushes `items` in order."""
+        for i, stage in enumerate(self._stages):
+            if stage.max_inflight:
+                self._start_async(i)
+                continue
+            for w in range(stage.workers):
+                threading.Thread(
+                    target=self._work,
+                    args=(i,),
+                    name=f"{self._name}-{stage.name}-{w}",
+                    daemon=True,
+                ).start()
+        threading.Thread(
+            target=self._feed, args=(items,), name=f"{self._name}-feeder", daemon=True
+        ).start()
+
+    def results(self, deadline: Optional[float] = None) -> Iterator[Tuple[bool, Any]]:
+        """
+        Yield `(completed, item)` for every input. Raises TimeoutError once
+        `deadline` (a `time.monotonic()` value) passes.
+        """
+        while not self._stop.is_set():
+            timeout = _POLL_S
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError("pipeline deadline exceeded")
+                timeout = min(timeout, remaining)
+            try:
+                entry = self._out.get(timeout=timeout)
+            except queue.Empty:
+                continue
+            if entry is _SENTINEL:
+                return
+            yield entry
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        return {stage.name: stage.stats() for stage in self._stages}
+
+    # ------------------------------------------------------------------
+
+    def _put(self, stage: Stage, item: Any) -> bool:
+        while True:
+            try:
+                stage.queue.put(item, timeout=_POLL_S)
+                break
+            except queue.Full:
+                if self._stop.is_set():
+                    return False
+        depth = stage.queue.qsize()
+        if item is not _SENTINEL and depth > stage.max_depth:
+            stage.max_depth = depth
+        return True
+
+    def _feed(self, items: Iterable[Any]) -> None:
+        first = self._stages[0]
+        try:
+            for item in items:
+                if self._stop.is_set() or not self._put(first, item):
+                    return
+        except Exception as e:
+            print(f"[Pipeline] Feeder error: {e}")
+        for _ in range(first.workers):
+            if not self._put(first, _SENTINEL):
+                return
+
+    def _work(self, index: int) -> None:
+        stage = self._stages[index]
+        nxt = self._stages[index + 1] if index + 1 < len(self._stages) else None
+        while not self._stop.is_set():
+            try:
+                item = stage.queue.get(timeout=_POLL_S)
+            except queue.Empty:
+                continue
+            if item is _SENTINEL:
+                break
+            try:
+                out = stage.fn(item)
+            except Exception as e:
+                out = self._failed(stage, item, e)
+            if not self._forward(stage, nxt, item, out):
+                break
+        else:
+            return
+
+        # Last worker of this stage to finish closes the next one.
+        with stage._lock:
+            stage._alive -= 1
+            last = stage._alive == 0
+        if last:
+            self._close(nxt)
+
+    def _failed(self, stage: Stage, item: Any, error: Exception) -> None:
+        print(f"[Pipeline] {stage.name} error: {error}")
+        if self._on_error is not None:
+            try:
+                self._on_error(item, error)
+            except Exception:
+                pass
+        return None
+
+    def _forward(self, stage: Stage, nxt: Optional[Stage], item: Any, out: Any) -> bool:
+        """Pass a stage result on; False once the pipeline has been stopped."""
+        if out is None:
+            stage.dropped += 1
+            self._out.put((False, item))
+            return True
+        stage.processed += 1
+        if nxt is None:
+            self._out.put((True, out))
+            return True
+        return self._put(nxt, out)
+
+    def _close(self, nxt: Optional[Stage]) -> None:
+        if nxt is None:
+            self._out.put(_SENTINEL)
+        else:
+            for _ in range(nxt.workers):
+                if not self._put(nxt, _SENTINEL):
+                    return
+
+    def _start_async(self, index: int) -> None:
+        stage = self._stages[index]
+        nxt = self._stages[index + 1] if index + 1 < len(self._stages) else None
+        slots = threading.Semaphore(stage.max_inflight)
+        # Unbounded, so future callbacks (which may run on an event loop)
+        # never block; `slots` bounds it anyway.
+        completed: "queue.Queue[Any]" = queue.Queue()
+
+        def on_done(item: Any, fut: Future) -> None:
+            completed.put((item, fut))
+
+        def dispatch() -> None:
+            submitted = 0
+            while not self._stop.is_set():
+                try:
+                    item = stage.queue.get(timeout=_POLL_S)
+                except queue.Empty:
+                    continue
+                if item is _SENTINEL:
+                    break
+                while not slots.acquire(timeout=_POLL_S):
+                    if self._stop.is_set():
+                        return
+                try:
+                    fut = stage.fn(item)
+                except Exception as e:
+                    slots.release()
+                    self._forward(stage, nxt, item, self._failed(stage, item, e))
+                    continue
+                submitted += 1
+                with stage._lock:
+                    stage.inflight += 1
+                fut.add_done_callback(lambda f, item=item: on_done(item, f))
+            else:
+                return
+            completed.put((_SENTINEL, submitted))
+
+        def collect() -> None:
+            forwarded, expected = 0, None
+            while expected is None or forwarded < expected:
+                try:
+                    item, fut = completed.get(timeout=_POLL_S)
+                except queue.Empty:
+                    if self._stop.is_set():
+                        return
+                    continue
+                if item is _SENTINEL:
+                    expected = fut
+                    continue
+                forwarded += 1
+                with stage._lock:
+                    stage.inflight -= 1
+                try:
+                    out = fut.result()
+                except Exception as e:
+                    out = self._failed(stage, item, e)
+                ok = self._forward(stage, nxt, item, out)
+                slots.release()
+                if not ok:
+                    return
+            self._close(nxt)
+
+        for target, role in ((dispatch, "dispatch"), (collect, "collect")):
+            threading.Thread(
+                target=target, name=f"{self._name}-{stage.name}-{role}", daemon=True
+            ).start()
@@ -0,0 +1,129 @@
+"""
+Small persistent key/value store with per-entry expiry.
+
+Why: several lookups are worth remembering across requests and across
+gunicorn workers but go stale on their own schedule (a resolved og:image URL
+dies with its CDN signature, a search result page ages out). This is the
+shared plumbing: SQLite in WAL mode like embedding_cache.py, string keys and
+values (callers JSON-encode anything richer), and an expiry per entry.
+
+- `get` returns the value together with whether it is still fresh. Expired
+  entries are kept for `stale_s` more seconds, so a caller can serve a stale
+  value while it refreshes it; after that they read as misses.
+- Entry-count LRU: every hit refreshes `last_used`, and past `max_entries`
+  the least recently used rows (dead ones first) are dropped.
+"""
+from __future__ import annotations
+
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, NamedTuple, Optional
+
+
+class TtlEntry(NamedTuple):
+    value: str
+    expires_at: float
+    fresh: bool
+
+
+class TtlStore:
+    def __init__(
+        self, path: str, max_entries: int, stale_s: float = 0.0, name: str = "TtlStore"
+    ) -> None:
+        self._max_entries = max(1, int(max_entries))
+        self._stale_s = max(0.0, stale_s)
+        self._name = name
+        self._lock = threading.Lock()
+        self._counts = {"hits": 0, "stale_hits": 0, "misses": 0, "stored": 0, "evicted": 0}
+
+        parent = os.path.dirname(path)
+        if parent:
+            os.makedirs(parent, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS entries_last_used ON entries(last_used);
+            """
+        )
+        self._conn.commit()
+        self._entries = int(self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0])
+
+    def get(self, key: str) -> Optional[TtlEntry]:
+        """Entry for `key`, or None if absent or past its stale window."""
+        now = time.time()
+        try:
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT value, expires_at FROM entries WHERE key = ?", (key,)
+                ).fetchone()
+                if row is None or row[1] + self._stale_s <= now:
+                    self._counts["misses"] += 1
+                    return None
+                self._conn.execute("UPDATE entries SET last_used = ? WHERE key = ?", (now, key))
+                self._conn.commit()
+                fresh = row[1] > now
+                self._counts["hits" if fresh else "stale_hits"] += 1
+        except sqlite3.Error as e:
+            print(f"[{self._name}] Read error: {e}")
+            return None
+        return TtlEntry(row[0], row[1], fresh)
+
+    def put(self, key: str, value: str, ttl_s: float) -> None:
+        now = time.time()
+        try:
+            with self._lock:
+                old = self._conn.execute("SELECT 1 FROM entries WHERE key = ?", (key,)).fetchone()
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO entries (key, value, expires_at, last_used) "
+                    "VALUES (?, ?, ?, ?)",
+                    (key, value, now + ttl_s, now),
+                )
+                if old is None:
+                    self._entries += 1
+                self._counts["stored"] += 1
+                if self._entries > self._max_entries:
+                    self._evict_locked(now)
+                self._conn.commit()
+        except sqlite3.Error as e:
+            print(f"[{self._name}] Write error: {e}")
+
+    def delete(self, key: str) -> None:
+        try:
+            with self._lock:
+                cur = self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self._entries -= cur.rowcount
+                self._conn.commit()
+        except sqlite3.Error as e:
+            print(f"[{self._name}] Write error: {e}")
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self._counts, "entries": self._entries}
+
+    def _evict_locked(self, now: float) -> None:
+        # Dead entries go first; then LRU down to 90% so we don't run an
+        # eviction on every insert.
+        cur = self._conn.execute(
+            "DELETE FROM entries WHERE expires_at + ? <= ?", (self._stale_s, now)
+        )
+        evicted = cur.rowcount
+        excess = self._entries - evicted - int(self._max_entries * 0.9)
+        if excess > 0:
+            cur = self._conn.execute(
+                "DELETE FROM entries WHERE key IN "
+                "(SELECT key FROM entries ORDER BY last_used ASC LIMIT ?)",
+                (excess,),
+            )
+            evicted += cur.rowcount
+        self._entries -= evicted
+        self._counts["evicted"] += evicted